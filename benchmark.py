@@ -0,0 +1,283 @@
+# Benchmarks for the hot paths of the enumeration and of the embedding
+# classification, on fixed inputs taken from saved_classification.
+#
+# Each benchmark is run for every number of points n in range, timed (best of
+# the repeats), and run once more under tracemalloc for its peak memory. It
+# returns a count, and a check of its output against the stored
+# classifications. One JSON line per benchmark and n is appended to the
+# history file, with the time, commit and host, so runs before and after a
+# change can be compared.
+#
+# Usage: python benchmark.py [-m min n] [-M max n] [-b benchmarks, comma
+#     separated] [-r repeats] [-k designs per n] [-check-max max n for the
+#     full classification check] [-o history file]
+
+import sys
+import json
+import time
+import socket
+import platform
+import resource
+import subprocess
+import tracemalloc
+import contextlib
+import io
+import ast
+from sg_design_finder import PartialDesign, find_all_seeds, \
+    all_full_completions, make_identifier_hash, enumerate_all_sg_designs, \
+    get_line_tables, make_identifier_hash_linelist, check_certificates
+from solve_exact_cover import solve, make_inputs
+from sg_solve_embedding import get_configs, forced_set, design_incidence, \
+    find_forcing_fixture, make_pt_coords, make_eqs, resolve_eqs_adaptive
+
+HISTORY_PATH = "benchmark_history.jsonl"
+EMBEDDING_PATH = "saved_classification/embedding_classification.txt"
+
+# number of seeds on 2 points with an initial line of 3 points, as found both
+# with known hashes and by canonical augmentation
+SEED_COUNTS = {7: 1, 8: 0, 9: 2, 10: 1, 11: 6, 12: 6, 13: 20, 14: 27, 15: 99,
+    16: 178}
+
+# the seed of a stored design: its lines through points 0 and 1
+def design_seed(pd):
+    return PartialDesign(pd.num_points,
+        [l for l in pd.lines if 0 in l or 1 in l])
+
+# the exact cover problem completing the seed of pd, as all_full_completions
+# sets it up: the pairs not on a line of the seed, covered by the lines which
+# can be added to it
+def cover_instance(pd):
+    seed = design_seed(pd)
+    n = pd.num_points
+    tables = get_line_tables(n)
+    pairs = [(i, j) for i in range(n) for j in range(i+1, n)
+        if not seed.is_connected(i, j)]
+    column = {p: c for c, p in enumerate(pairs)}
+    Y = {}
+    for l in range(3, n//2 + 2):
+        for line in tables.all_lines_with_len[l]:
+            if seed.can_add(line):
+                Y[len(Y)] = [column[(a, b)] for a in line for b in line
+                    if a < b]
+    return make_inputs(set(range(len(pairs))), Y)
+
+def first_designs(n, k):
+    configs = get_configs(n)
+    return [configs[i] for i in range(min(k, len(configs)))]
+
+_embedding_verdicts = {}
+
+# the verdict of each design of the embedding classification, "not 
+# embeddable" or "possibly embeddable", by certificate
+def embedding_verdicts():
+    if not _embedding_verdicts:
+        with open(EMBEDDING_PATH, "r") as embf:
+            blocks = embf.read().split("\n\n")
+        for block in blocks:
+            lines = block.strip().split("\n")
+            header = [l for l in lines if l.endswith("points.")]
+            if not header:
+                continue
+            n = int(header[0].split()[-2])
+            design = [ast.literal_eval(l) for l in lines if l.startswith("(")]
+            verdict = "possibly embeddable" if \
+                header[0].startswith("Possibly") else "not embeddable"
+            _embedding_verdicts[make_identifier_hash_linelist(n, design)] = \
+                verdict
+    return _embedding_verdicts
+
+"""
+Benchmarks. Each takes n and the number k of stored designs to use, and
+returns a function running the benchmark, which returns (count, check): check
+is True or False if the output could be checked, or None.
+"""
+def bench_seeds(n, k):
+    def run():
+        seeds = find_all_seeds(n, 3, 2, verbose = False)
+        return len(seeds), SEED_COUNTS.get(n) == len(seeds) \
+            if n in SEED_COUNTS else None
+    return run
+
+def bench_exact_cover(n, k):
+    designs = first_designs(n, k)
+    def run():
+        # every stored design is a completion of its own seed
+        counts = [sum(1 for s in solve(*cover_instance(pd)))
+            for pd in designs]
+        return sum(counts), all(c > 0 for c in counts)
+    return run
+
+def bench_completions(n, k):
+    designs = first_designs(n, k)
+    def run():
+        count = 0
+        check = True
+        for pd in designs:
+            found = all_full_completions(design_seed(pd), with_hashes = True)
+            count += len(found)
+            check = check and make_identifier_hash(pd) in \
+                set(h for h, c in found)
+        return count, check
+    return run
+
+def bench_certificates(n, k):
+    designs = list(get_configs(n))
+    # the shared graphs of certificates_linelist give the certificates of
+    # make_bipartite_for_design
+    shared_ok = check_certificates(first_designs(n, k))
+    def run():
+        certs = set(make_identifier_hash(pd) for pd in designs)
+        # the stored designs are pairwise non-isomorphic
+        return len(certs), shared_ok and len(certs) == len(designs)
+    return run
+
+def bench_forced_set(n, k):
+    designs = first_designs(n, k)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fixtures = [find_forcing_fixture(pd)[0] for pd in designs]
+    def run():
+        count = 0
+        check = True
+        for pd, fixture in zip(designs, fixtures):
+            incidence = design_incidence(pd)
+            for a in range(n):
+                for b in range(a+1, n):
+                    for c in range(b+1, n):
+                        count += len(forced_set(pd, (a, b, c), incidence)[0])
+            if fixture != False:
+                check = check and len(forced_set(pd, fixture)[0]) == n
+        return count, check
+    return run
+
+def bench_fixture(n, k):
+    designs = first_designs(n, k)
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            fixtures = [find_forcing_fixture(pd)[0] for pd in designs]
+        check = all(len(forced_set(pd, fixture)[0]) == n
+            for pd, fixture in zip(designs, fixtures) if fixture != False)
+        return sum(1 for f in fixtures if f != False), check
+    return run
+
+# the groebner step as the embedding sweep runs it, checked against the
+# verdicts of the embedding classification
+def bench_groebner(n, k):
+    all_eqs = []
+    verdicts = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for pd in first_designs(n, k):
+            init, fo = find_forcing_fixture(pd)
+            if init != False and len(init) <= 5:
+                eqs = make_eqs(pd, make_pt_coords(pd, fo))
+                if eqs != False:
+                    all_eqs.append(eqs)
+                    verdicts.append(embedding_verdicts().get(
+                        make_identifier_hash(pd)))
+    def run():
+        found = [resolve_eqs_adaptive(eqs)[0] for eqs in all_eqs]
+        check = all(verdict == {True: "not embeddable", 
+            False: "possibly embeddable", None: None}[one_in_ideal] 
+            for one_in_ideal, verdict in zip(found, verdicts))
+        if not all_eqs:
+            check = None
+        return sum(1 for one_in_ideal in found if one_in_ideal), check
+    return run
+
+def bench_classification(n, k):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            designs = enumerate_all_sg_designs(n)
+        return len(designs), len(designs) == len(get_configs(n))
+    return run
+
+BENCHMARKS = {
+    "seeds": bench_seeds,
+    "exact_cover": bench_exact_cover,
+    "completions": bench_completions,
+    "certificates": bench_certificates,
+    "forced_set": bench_forced_set,
+    "fixture": bench_fixture,
+    "groebner": bench_groebner,
+    "classification": bench_classification,
+}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+            stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# run a benchmark on n, and return its record
+def run_benchmark(name, n, k = 5, repeats = 1):
+    run = BENCHMARKS[name](n, k)
+    best = None
+    for r in range(repeats):
+        start = time.perf_counter()
+        count, check = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"benchmark": name, "n": n, "seconds": best, "repeats": repeats,
+        "peak_bytes": peak,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "count": count, "check": check}
+
+# run the benchmarks for minn <= n <= maxn, the full classification only up to
+# check_max, and append their records to the history file. Returns the records.
+def run_benchmarks(names = list(BENCHMARKS), minn = 10, maxn = 16, k = 5,
+        repeats = 1, check_max = 13, history_path = HISTORY_PATH):
+    run_info = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(), "host": socket.gethostname(),
+        "python": platform.python_version()}
+    records = []
+    with open(history_path, "a") as historyf:
+        for name in names:
+            for n in range(minn, maxn+1):
+                if name == "classification" and n > check_max:
+                    continue
+                record = dict(run_info, **run_benchmark(name, n, k, repeats))
+                historyf.write(json.dumps(record) + "\n")
+                historyf.flush()
+                records.append(record)
+                print("{:>15} n={:<3} {:10.4f}s {:10.1f}MB count {:<8} {}".format(
+                    name, n, record["seconds"], record["peak_bytes"] / 2**20,
+                    record["count"], {True: "ok", False: "FAILED",
+                    None: ""}[record["check"]]))
+    return records
+
+
+if __name__ == '__main__':
+    names = list(BENCHMARKS)
+    minn = 10
+    maxn = 16
+    repeats = 1
+    k = 5
+    check_max = 13
+    history_path = HISTORY_PATH
+    for a, b in zip(sys.argv, sys.argv[1:]):
+        if a == "-m":
+            minn = int(b)
+        if a == "-M":
+            maxn = int(b)
+        if a == "-b":
+            names = b.split(",")
+        if a == "-r":
+            repeats = int(b)
+        if a == "-k":
+            k = int(b)
+        if a == "-check-max":
+            check_max = int(b)
+        if a == "-o":
+            history_path = b
+
+    records = run_benchmarks(names, minn, maxn, k, repeats, check_max,
+        history_path)
+    if any(record["check"] == False for record in records):
+        print("Some checks FAILED")
+        sys.exit(1)
@@ -0,0 +1,233 @@
+# A set of pynauty certificates for isomorph rejection, which does not keep the
+# certificates themselves in memory.
+#
+# Each certificate added gets an id, its position in the order of addition.
+# The full certificates are appended to a file on disk, and in memory only a 16
+# byte digest of each is kept, mapping to its id. The digests are partitioned
+# by the degree sequence of the certificate's graph (for a design, its line
+# lengths and point degrees), and when the estimated memory used goes over a
+# budget, the largest partitions are moved to an open addressing hash table in
+# a memory mapped file. A digest found is checked against the full certificate
+# on disk, so distinct certificates with equal digests are still told apart.
+#
+# The store lives in a directory:
+#  - certificates.bin: each certificate as a 4 byte length and its bytes
+#  - spill.table: the hash table of spilled digests, slots of two uint64 for
+#    the digest and an int64 id + 1 (0 for an empty slot)
+
+import os
+import shutil
+import hashlib
+import tempfile
+import array
+import numpy as np
+
+DIGEST_SIZE = 16
+MEMORY_BUDGET = 2**30
+# estimated bytes of memory for each digest kept in memory
+ENTRY_BYTES = 120
+
+# the files a store may leave in its directory
+STORE_FILES = ["certificates.bin", "spill.table", "spill.table.new"]
+
+SLOT_DTYPE = np.dtype([("d0", "<u8"), ("d1", "<u8"), ("id", "<i8")])
+
+# number of set bits of each byte
+BYTE_POPCOUNT = np.array([bin(b).count("1") for b in range(256)], 
+    dtype=np.uint16)
+
+# number of vertices of the graph of a certificate, by certificate length
+_num_vertices = {}
+
+# the sorted degrees of the vertices of the graph of a pynauty certificate, as
+# bytes. A certificate of a graph on V vertices holds V rows of adjacency bits,
+# each padded to a multiple of 64 bits.
+def degree_invariant(cert):
+    if len(cert) not in _num_vertices:
+        num_vert = 1
+        while num_vert * ((num_vert + 63) // 64) * 8 < len(cert):
+            num_vert += 1
+        _num_vertices[len(cert)] = num_vert
+    rows = BYTE_POPCOUNT[np.frombuffer(cert, dtype=np.uint8)]
+    degrees = rows.reshape(_num_vertices[len(cert)], -1).sum(axis=1)
+    degrees.sort()
+    return degrees.tobytes()
+
+class CertificateStore:
+    # path: directory for the store, or None for a temporary directory that is
+    # removed by close(). An existing directory is reused if it holds nothing
+    # but the files of an earlier store, which are removed.
+    # memory_budget: bytes of memory for digests before partitions are spilled
+    # invariant: function from a certificate to the bytes of its partition
+    def __init__(self, path = None, memory_budget = MEMORY_BUDGET,
+            invariant = degree_invariant):
+        self.temporary = path == None
+        if self.temporary:
+            path = tempfile.mkdtemp(prefix = "certificates_")
+        else:
+            if os.path.exists(path):
+                if not os.path.isdir(path):
+                    raise ValueError("{} is not a directory".format(path))
+                others = set(os.listdir(path)) - set(STORE_FILES)
+                if len(others) > 0:
+                    raise ValueError("{} holds files that are not from a "
+                        "certificate store: {}".format(path, sorted(others)))
+                for fn in os.listdir(path):
+                    os.remove(os.path.join(path, fn))
+            else:
+                os.makedirs(path)
+        self.path = path
+        self.memory_budget = memory_budget
+        self.invariant = invariant
+
+        self.cert_fd = os.open(os.path.join(path, "certificates.bin"),
+            os.O_RDWR | os.O_CREAT | os.O_APPEND)
+        self.cert_end = 0
+        # offset of each certificate in certificates.bin, by id
+        self.offsets = array.array("q")
+
+        # in memory partitions, digest -> id
+        self.partitions = {}
+        self.num_in_memory = 0
+        # partitions moved to the hash table
+        self.spilled = set()
+        self.table = None
+        self.table_used = 0
+        # certificates whose digest equals that of another certificate
+        self.collisions = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, cert):
+        return self.get(cert) != None
+
+    # the id of cert, or None if it was never added
+    def get(self, cert):
+        if cert in self.collisions:
+            return self.collisions[cert]
+        key = self.invariant(cert)
+        cert_id = self._find_digest(key, self._digest(cert))
+        if cert_id != None and self._read(cert_id) == cert:
+            return cert_id
+        return None
+
+    # add cert, and return its id. A certificate already in the store keeps
+    # its id.
+    def add(self, cert):
+        if cert in self.collisions:
+            return self.collisions[cert]
+        key = self.invariant(cert)
+        digest = self._digest(cert)
+        cert_id = self._find_digest(key, digest)
+        if cert_id != None:
+            if self._read(cert_id) == cert:
+                return cert_id
+            cert_id = self._append(cert)
+            self.collisions[cert] = cert_id
+            return cert_id
+
+        cert_id = self._append(cert)
+        if key in self.spilled:
+            self._table_insert(digest, cert_id)
+        else:
+            self.partitions.setdefault(key, {})[digest] = cert_id
+            self.num_in_memory += 1
+            if self.num_in_memory * ENTRY_BYTES > self.memory_budget:
+                self._spill()
+        return cert_id
+
+    # remove the files of a temporary store
+    def close(self):
+        if self.cert_fd != None:
+            os.close(self.cert_fd)
+            self.cert_fd = None
+        self.table = None
+        if self.temporary and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    def _digest(self, cert):
+        return hashlib.blake2b(cert, digest_size = DIGEST_SIZE).digest()
+
+    def _append(self, cert):
+        os.write(self.cert_fd, len(cert).to_bytes(4, "little") + cert)
+        self.offsets.append(self.cert_end)
+        self.cert_end += 4 + len(cert)
+        return len(self.offsets) - 1
+
+    def _read(self, cert_id):
+        offset = self.offsets[cert_id]
+        length = int.from_bytes(os.pread(self.cert_fd, 4, offset), "little")
+        return os.pread(self.cert_fd, length, offset + 4)
+
+    def _find_digest(self, key, digest):
+        if key in self.spilled:
+            return self._table_find(digest)
+        return self.partitions.get(key, {}).get(digest)
+
+    # move the largest partitions to the hash table, until the digests in
+    # memory fit in half the budget
+    def _spill(self):
+        by_size = sorted(self.partitions,
+            key = lambda key: len(self.partitions[key]), reverse = True)
+        for key in by_size:
+            if self.num_in_memory * ENTRY_BYTES <= self.memory_budget // 2:
+                break
+            partition = self.partitions.pop(key)
+            self.spilled.add(key)
+            self.num_in_memory -= len(partition)
+            for digest, cert_id in partition.items():
+                self._table_insert(digest, cert_id)
+
+    # slot of digest in the hash table: the slot holding it, or the empty slot
+    # where it would go
+    def _table_slot(self, digest):
+        d0 = int.from_bytes(digest[:8], "little")
+        d1 = int.from_bytes(digest[8:16], "little")
+        mask = len(self.table) - 1
+        slot = d0 & mask
+        while True:
+            entry = self.table[slot]
+            if entry["id"] == 0 or (entry["d0"] == d0 and entry["d1"] == d1):
+                return slot, d0, d1
+            slot = (slot + 1) & mask
+
+    def _table_find(self, digest):
+        if self.table is None:
+            return None
+        slot, d0, d1 = self._table_slot(digest)
+        cert_id = int(self.table[slot]["id"])
+        return cert_id - 1 if cert_id > 0 else None
+
+    def _table_insert(self, digest, cert_id):
+        if self.table is None or 2 * (self.table_used + 1) > len(self.table):
+            self._table_grow()
+        slot, d0, d1 = self._table_slot(digest)
+        self.table[slot] = (d0, d1, cert_id + 1)
+        self.table_used += 1
+
+    # double the capacity of the hash table, keeping its load at most one half
+    def _table_grow(self):
+        old = self.table
+        capacity = 1 << 16 if old is None else 2 * len(old)
+        fn = os.path.join(self.path, "spill.table")
+        self.table = np.memmap(fn + ".new", dtype = SLOT_DTYPE, mode = "w+",
+            shape = (capacity,))
+        if old is not None:
+            mask = capacity - 1
+            for entry in old[old["id"] != 0]:
+                slot = int(entry["d0"]) & mask
+                while self.table[slot]["id"] != 0:
+                    slot = (slot + 1) & mask
+                self.table[slot] = entry
+            del old
+        os.replace(fn + ".new", fn)
+
+# ids for hashable keys which are not certificates, kept in a dict, with the 
+# same add and get as CertificateStore
+class KeyIds(dict):
+    def add(self, key):
+        return self.setdefault(key, len(self))
+
+    def close(self):
+        pass
@@ -0,0 +1,103 @@
+# Checkpoints for long classification runs, so that an interrupted run of
+# sg_design_finder.py can be resumed with its -resume flag.
+#
+# A checkpoint is a directory holding, for each stage of the enumeration:
+#  - <stage>.dill: the designs (as lists of lines) produced by a finished stage
+#  - <stage>.log: an append-only log for a stage processed item by item, in
+#    any order. A finished item appends one line per design it kept,
+#        design <item> <position> <certificate in hex> <line bitmasks, comma
+#        separated>
+#    followed by a line "item <item>". Designs not followed by the line of
+#    their item come from an item that did not finish, and are ignored when
+#    resuming.
+# and a file "done" once the classification it was made for is saved.
+
+import os
+import time
+import shutil
+import dill
+
+# seconds between forced writes of a stage log to disk. The log is flushed
+# after every item, so it survives the process being killed, and only a crash
+# of the machine can lose the items of the last SYNC_INTERVAL seconds.
+SYNC_INTERVAL = 10
+
+class Checkpoint:
+    # path: directory of the checkpoint
+    # resume: if False, any checkpoint already in path is discarded
+    def __init__(self, path, resume = False):
+        self.path = path
+        if not resume and os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok = True)
+        self.last_sync = time.time()
+
+    def _file(self, stage, ext):
+        return os.path.join(self.path, stage + ext)
+
+    # True if the designs of stage were saved
+    def has_stage(self, stage):
+        return os.path.exists(self._file(stage, ".dill"))
+
+    # save the designs of a finished stage, given as lists of lines. The file is
+    # written under a temporary name and then renamed, so a crash while saving
+    # does not leave a partial file behind.
+    def save_stage(self, stage, designs_lines):
+        fn = self._file(stage, ".dill")
+        with open(fn + ".tmp", "wb") as dillf:
+            dill.dump(designs_lines, dillf)
+            dillf.flush()
+            os.fsync(dillf.fileno())
+        os.replace(fn + ".tmp", fn)
+
+    def load_stage(self, stage):
+        with open(self._file(stage, ".dill"), "rb") as dillf:
+            return dill.load(dillf)
+
+    # read the log of a stage processed item by item. Returns the set of 
+    # finished items, and the (item, position, certificate, line masks) 
+    # records of their designs, in the order they were logged.
+    def load_items(self, stage):
+        finished = set()
+        records = []
+        pending = []
+        fn = self._file(stage, ".log")
+        if not os.path.exists(fn):
+            return finished, records
+
+        with open(fn, "r") as logf:
+            for line in logf:
+                parts = line.split()
+                if len(parts) == 5 and parts[0] == "design":
+                    masks = tuple(int(m) for m in parts[4].split(",") if m)
+                    pending.append((int(parts[1]), int(parts[2]), 
+                        bytes.fromhex(parts[3]), masks))
+                elif len(parts) == 2 and parts[0] == "item":
+                    item = int(parts[1])
+                    finished.add(item)
+                    records += [r for r in pending if r[0] == item]
+                    pending = [r for r in pending if r[0] != item]
+        return finished, records
+
+    # append the (position, certificate, line masks) records of a finished 
+    # item, then mark the item as finished
+    def append_item(self, stage, item, records):
+        with open(self._file(stage, ".log"), "a") as logf:
+            logf.write("".join("design {} {} {} {}\n".format(item, pos, 
+                h.hex(), ",".join(str(m) for m in masks)) 
+                for pos, h, masks in records) + "item {}\n".format(item))
+            logf.flush()
+            if time.time() - self.last_sync >= SYNC_INTERVAL:
+                os.fsync(logf.fileno())
+                self.last_sync = time.time()
+
+    # True if the classification the checkpoint was made for is saved
+    def is_done(self):
+        return os.path.exists(os.path.join(self.path, "done"))
+
+    # once the results have been saved, remove the stages of the checkpoint 
+    # and mark it done, so that a resumed run skips it
+    def mark_done(self):
+        shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        open(os.path.join(self.path, "done"), "w").close()
@@ -1,12 +1,10 @@
-import dill
+from design_store import load_designs
 
 def load_points(n):
-    fn = "saved_classification/all_unique_sg_{}.dill".format(n)
-    with open(fn, "rb") as dataf:
-        all_sols = dill.load(dataf)
+    all_sols = load_designs(n)
 
     print("Found {} solutions for {} points".format(len(all_sols), n))
-    for i,s in enumerate(all_sols):
-        for l in s:
+    for i in range(len(all_sols)):
+        for l in all_sols.lines(i):
             print(l)
         print("\n\n")
\ No newline at end of file
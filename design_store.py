@@ -0,0 +1,116 @@
+# Compact binary store for classifications of Sylvester-Gallai designs, read
+# through numpy.memmap so that loading a classification does not unpickle
+# anything, and designs are only built when they are accessed.
+#
+# A store file (saved_classification/all_unique_sg_<n>.sgd) is laid out as
+#  - a 24 byte header: magic b"SGDESIGN", format version (uint32), number of
+#    points n (uint32), number of designs D (uint64)
+#  - D+1 offsets (int64): the lines of design i are entries offsets[i] up to
+#    offsets[i+1] of the line array
+#  - the line array (uint64): each line as the bitmask of the points on it
+# all in little endian. Together the line masks of a design are its point-line
+# incidence matrix, one fixed-width row per line.
+#
+# Run this file to convert the dill files of saved_classification to stores.
+
+import os
+import sys
+import numpy as np
+
+MAGIC = b"SGDESIGN"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"),
+    ("num_points", "<u4"), ("num_designs", "<u8")])
+
+def store_path(n, directory = "saved_classification"):
+    return os.path.join(directory, "all_unique_sg_{}.sgd".format(n))
+
+# write the designs on num_points points, given as lists of lines, to path. The
+# file is written under a temporary name and then renamed, so that readers
+# never see a partial store.
+def write_designs(path, num_points, designs_lines):
+    if num_points > 64:
+        raise ValueError("can only store designs on at most 64 points")
+
+    offsets = np.zeros(len(designs_lines) + 1, dtype="<i8")
+    offsets[1:] = np.cumsum([len(lines) for lines in designs_lines])
+    masks = np.zeros(offsets[-1], dtype="<u8")
+    for i, lines in enumerate(designs_lines):
+        for j, l in enumerate(lines):
+            mask = 0
+            for p in l:
+                mask |= 1 << p
+            masks[offsets[i] + j] = mask
+
+    header = np.array([(MAGIC, VERSION, num_points, len(designs_lines))],
+        dtype=HEADER_DTYPE)
+    with open(path + ".tmp", "wb") as storef:
+        storef.write(header.tobytes())
+        storef.write(offsets.tobytes())
+        storef.write(masks.tobytes())
+    os.replace(path + ".tmp", path)
+
+class DesignStore:
+    # open the store at path. Only the header is read here, the offsets and
+    # line masks are mapped and read as they are used.
+    def __init__(self, path):
+        self.path = path
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        header = data[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError("{} is not a design store".format(path))
+
+        self.num_points = int(header["num_points"])
+        self.num_designs = int(header["num_designs"])
+        start = HEADER_DTYPE.itemsize
+        end = start + 8 * (self.num_designs + 1)
+        self.offsets = data[start:end].view("<i8")
+        self.masks = data[end:].view("<u8")
+
+    def __len__(self):
+        return self.num_designs
+
+    # line bitmasks of design i, as python ints
+    def line_masks(self, i):
+        if i < 0:
+            i += self.num_designs
+        if not 0 <= i < self.num_designs:
+            raise IndexError("design index out of range")
+        return [int(m) for m in self.masks[self.offsets[i]:self.offsets[i+1]]]
+
+    # lines of design i, each a sorted tuple of points
+    def lines(self, i):
+        return [tuple(p for p in range(self.num_points) if (m >> p) & 1)
+            for m in self.line_masks(i)]
+
+    # design i as a PartialDesign
+    def __getitem__(self, i):
+        # imported here, as sg_design_finder itself writes stores
+        from sg_design_finder import PartialDesign
+        return PartialDesign(self.num_points, self.lines(i))
+
+    def __iter__(self):
+        for i in range(self.num_designs):
+            yield self[i]
+
+# open the stored classification of designs on n points
+def load_designs(n, directory = "saved_classification"):
+    return DesignStore(store_path(n, directory))
+
+# convert the dill file of the classification on n points to a store
+def convert_dill(n, directory = "saved_classification"):
+    import dill
+    fn = os.path.join(directory, "all_unique_sg_{}.dill".format(n))
+    with open(fn, "rb") as dillf:
+        all_solutions_lines = dill.load(dillf)
+    write_designs(store_path(n, directory), n, all_solutions_lines)
+    print("Converted {} designs on {} points".format(
+        len(all_solutions_lines), n))
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else "saved_classification"
+    for fn in sorted(os.listdir(directory)):
+        if fn.startswith("all_unique_sg_") and fn.endswith(".dill"):
+            convert_dill(int(fn[len("all_unique_sg_"):-len(".dill")]),
+                directory)
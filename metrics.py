@@ -0,0 +1,162 @@
+# Opt-in metrics for long runs: counters, stage timers and progress, written as
+# periodic JSON lines snapshots with throughput and an estimate of the time
+# left in the current stage.
+#
+# Nothing is recorded until enable() is called, and every function here
+# returns at once while metrics are disabled. Pool workers inherit the enabled
+# state when they are forked. They do not write snapshots themselves, but
+# return take_delta() with their results, and the parent adds it with
+# add_delta().
+#
+# A snapshot line has
+#  - time, elapsed: the date, and seconds since enable()
+#  - counters: the totals of all counters, and rates: their increase per
+#    second since the previous snapshot
+#  - stages: for each stage, the seconds spent in it (summed over the workers
+#    for a stage run in workers), the number of times it ran, and for a stage
+#    with progress reported, done, total, rate in items per second and eta in
+#    seconds
+#  - current: the stages running, outermost first
+
+import os
+import json
+import time
+import collections
+import contextlib
+
+enabled = False
+
+_counters = collections.Counter()
+_stage_seconds = collections.Counter()
+_stage_runs = collections.Counter()
+# stage -> (done, total, seconds in the stage when progress was reported)
+_progress = {}
+# (stage, start time) of the stages running
+_current = []
+# counters, stage seconds and stage runs since the last take_delta()
+_delta_counters = collections.Counter()
+_delta_seconds = collections.Counter()
+_delta_runs = collections.Counter()
+
+_file = None
+_owner = None
+_interval = 60
+_start = None
+_last_snapshot = None
+_last_counters = collections.Counter()
+
+# a forked worker starts with no delta of its own
+def _reset_delta():
+    _delta_counters.clear()
+    _delta_seconds.clear()
+    _delta_runs.clear()
+os.register_at_fork(after_in_child = _reset_delta)
+
+# start recording metrics, writing a snapshot to path every interval seconds
+def enable(path, interval = 60):
+    global enabled, _file, _owner, _interval, _start, _last_snapshot
+    enabled = True
+    _file = open(path, "a")
+    _owner = os.getpid()
+    _interval = interval
+    _start = _last_snapshot = time.time()
+
+# write a final snapshot and stop recording
+def disable():
+    global enabled, _file
+    if not enabled:
+        return
+    snapshot()
+    enabled = False
+    if _file != None and os.getpid() == _owner:
+        _file.close()
+    _file = None
+
+def count(name, k = 1):
+    if enabled:
+        _counters[name] += k
+        _delta_counters[name] += k
+
+# time the code in a with block as a stage
+@contextlib.contextmanager
+def stage(name):
+    if not enabled:
+        yield
+        return
+    _current.append((name, time.time()))
+    try:
+        yield
+    finally:
+        name, start = _current.pop()
+        _stage_seconds[name] += time.time() - start
+        _delta_seconds[name] += time.time() - start
+        _stage_runs[name] += 1
+        _delta_runs[name] += 1
+        maybe_snapshot()
+
+# report that done of total items of the innermost running stage are finished,
+# counting from the start of its current run
+def progress(done, total):
+    if not enabled or not _current:
+        return
+    name, start = _current[-1]
+    _progress[name] = (done, total, time.time() - start)
+    maybe_snapshot()
+
+# the counters and stage times recorded since the last call, for a worker to
+# return to the parent, or None while disabled
+def take_delta():
+    if not enabled:
+        return None
+    delta = {"counters": dict(_delta_counters),
+        "stage_seconds": dict(_delta_seconds),
+        "stage_runs": dict(_delta_runs)}
+    _reset_delta()
+    return delta
+
+# add a delta returned by a worker
+def add_delta(delta):
+    if not enabled or delta == None:
+        return
+    _counters.update(delta["counters"])
+    _stage_seconds.update(delta["stage_seconds"])
+    _stage_runs.update(delta["stage_runs"])
+
+def maybe_snapshot():
+    if enabled and time.time() - _last_snapshot >= _interval:
+        snapshot()
+
+def snapshot():
+    global _last_snapshot, _last_counters
+    if not enabled or _file == None or os.getpid() != _owner:
+        return
+    now = time.time()
+    since = max(now - _last_snapshot, 1e-9)
+    running = dict(_current)
+
+    stages = {}
+    for name in set(_stage_seconds) | set(running):
+        seconds = _stage_seconds[name]
+        if name in running:
+            seconds += now - running[name]
+        info = {"seconds": seconds, "runs": _stage_runs[name]}
+        if name in _progress:
+            done, total, at = _progress[name]
+            info["done"] = done
+            info["total"] = total
+            if done > 0 and at > 0:
+                info["rate"] = done / at
+                info["eta"] = (total - done) * at / done
+        stages[name] = info
+
+    line = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "elapsed": now - _start,
+        "counters": dict(_counters),
+        "rates": {name: (_counters[name] - _last_counters[name]) / since
+            for name in _counters},
+        "stages": stages,
+        "current": [name for name, start in _current]}
+    _file.write(json.dumps(line) + "\n")
+    _file.flush()
+    _last_snapshot = now
+    _last_counters = collections.Counter(_counters)
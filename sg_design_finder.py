@@ -4,10 +4,15 @@
 import pynauty
 import itertools
 import numpy as np
-import copy
 from solve_exact_cover import *
-import dill
+from checkpoint import Checkpoint
+from design_store import write_designs, store_path
+from certificate_store import CertificateStore, KeyIds
+import metrics
 import sys
+import collections
+import functools
+import queue
 import multiprocessing
 from multiprocessing import Pool
 
@@ -16,8 +21,13 @@ from multiprocessing import Pool
 PartialDesign class for recording point-line designs
 It is a partial design because not every two points has a line passing through 
 it, only some do. 
+The design is stored compactly: connected[v] is an integer bitmask of the points
+already sharing a line with v, so checking and updating a line is a handful of
+bitwise operations, and copying a design only copies two lists and a set.
 """
 class PartialDesign:
+    __slots__ = ("num_points", "lines", "line_set", "connected")
+
     # Initialize partial design with num_points points, and some initial set 
     # of lines. 
     # - num_points: number of points in the design
@@ -26,53 +36,128 @@ class PartialDesign:
     #   the points on that line.
     def __init__(self, num_points, lines):
         self.lines = []
+        self.line_set = set()
         self.num_points = num_points
-        self.has_line = np.zeros((num_points, num_points), dtype=np.bool)
+        self.connected = [0] * num_points
 
         for l in lines:
             self.add_line(l)
 
     # l = [x_0, ..., x_k], the points on a line to be added. Adds that lines to
-    # self.lines, and updates the "has_line" array as well.
+    # self.lines, and updates the "connected" masks as well.
     def add_line(self, l):
         l = tuple(sorted(l))
-        if l in self.lines:
+        if l in self.line_set:
             return
 
-        self.lines.append(l)
-        for v1 in l:
-            for v2 in l:
-                if v1 == v2:
-                    continue
-                # if this was already true, then line is illegal
-                assert(self.has_line[v1, v2] == False)
+        mask = line_mask(l)
+        for v in l:
+            # if v was already connected to a point of l, then line is illegal
+            assert(self.connected[v] & mask == 0)
 
-                # there is now a line passing through v1, v2
-                self.has_line[v1, v2] = True
+        self.lines.append(l)
+        self.line_set.add(l)
+        for v in l:
+            # there is now a line passing through v and every other point of l
+            self.connected[v] |= mask ^ (1 << v)
 
-    # remove a line from self.lines if it exists, and update "has_line" array
+    # remove a line from self.lines if it exists, and update "connected" masks
     def remove_line(self, l):
         l = tuple(sorted(l))
-        if l not in self.lines:
+        if l not in self.line_set:
             return
 
-        self.lines.remove(l)
-        for v1 in l:
-            for v2 in l:
-                if v1 == v2:
-                    continue
-                self.has_line[v1, v2] = False
+        # the search always removes the line it added last, so check that first
+        if self.lines[-1] == l:
+            self.lines.pop()
+        else:
+            self.lines.remove(l)
+        self.line_set.remove(l)
+
+        mask = line_mask(l)
+        for v in l:
+            self.connected[v] &= ~mask
 
     # check if a line passes through two points already lying on a line
-    def can_add(self, l):
-        for v1 in l:
-            for v2 in l:
-                if v1 == v2:
-                    continue
-                if self.has_line[v1, v2]:
-                    return False
+    # mask may be given if the line's bitmask is already known
+    def can_add(self, l, mask = None):
+        if mask == None:
+            mask = line_mask(l)
+        for v in l:
+            if self.connected[v] & mask:
+                return False
         return True
 
+    # vectorized can_add: takes a uint64 array of line bitmasks, and returns a 
+    # boolean array which is True for the lines that can be added
+    def can_add_masks(self, masks):
+        # union of the points connected to some point of each line, looked up 
+        # one byte of the line mask at a time
+        covered = np.zeros(len(masks), dtype=np.uint64)
+        byte_values = np.arange(256, dtype=np.uint64)
+        for start in range(0, self.num_points, 8):
+            # table[b] is the union of connected[start + i] for bits i of b
+            table = np.zeros(256, dtype=np.uint64)
+            for i in range(min(8, self.num_points - start)):
+                has_bit = (byte_values >> np.uint64(i)) & np.uint64(1) == 1
+                table[has_bit] |= np.uint64(self.connected[start + i])
+            line_bytes = (masks >> np.uint64(start)) & np.uint64(255)
+            covered |= table[line_bytes.astype(np.intp)]
+        can_add = (covered & masks) == 0
+        if metrics.enabled:
+            metrics.count("lines_rejected", 
+                len(masks) - int(np.count_nonzero(can_add)))
+        return can_add
+
+    # True if there is a line passing through v1 and v2
+    def is_connected(self, v1, v2):
+        return (self.connected[v1] >> v2) & 1 == 1
+
+    # True if v lies on a line with every other point
+    def is_saturated(self, v):
+        return self.connected[v] == ((1 << self.num_points) - 1) ^ (1 << v)
+
+    # num_points x num_points boolean matrix, True where a line passes through
+    # both points. Kept for code that still indexes the old array, it is built
+    # on demand so should not be used in inner loops.
+    @property
+    def has_line(self):
+        has_line = np.zeros((self.num_points, self.num_points), dtype=bool)
+        for v1 in range(self.num_points):
+            for v2 in range(self.num_points):
+                has_line[v1, v2] = self.is_connected(v1, v2)
+        return has_line
+
+    # cheap copy of the design, used in place of copy.deepcopy when branching
+    def copy(self):
+        new_pd = PartialDesign.__new__(PartialDesign)
+        new_pd.num_points = self.num_points
+        new_pd.lines = list(self.lines)
+        new_pd.line_set = set(self.line_set)
+        new_pd.connected = list(self.connected)
+        return new_pd
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+# bitmask with bit p set for each point p on the line l
+def line_mask(l):
+    mask = 0
+    for p in l:
+        mask |= 1 << p
+    return mask
+
+# inverse of line_mask: the sorted tuple of points set in mask
+def mask_line(mask):
+    return tuple(p for p in range(mask.bit_length()) if (mask >> p) & 1)
+
+# partial design on n points from a list of line bitmasks
+def design_from_masks(n, masks):
+    return PartialDesign(n, [mask_line(m) for m in masks])
+
 """
 Make a bipartite incidence graph for a point-line design
 - pd - partial design object representing point-line design
@@ -112,7 +197,10 @@ def make_bipartite_for_design(pd):
 
     return g
 
-def make_bipartite_for_design_linelist(num_points, line_list):
+# point_coloring optionally splits the points into several color classes, given
+# as a list of sets. Isomorphisms of the resulting graph must preserve them.
+def make_bipartite_for_design_linelist(num_points, line_list, 
+        point_coloring = None):
     # we have num points + num lines vertices
     # first are the points, then then lines
     # the points have color 0 and lines have color 1
@@ -120,7 +208,9 @@ def make_bipartite_for_design_linelist(num_points, line_list):
     num_vert = num_points + num_lines
     # different colors for lines and for points of each pencil type
     lineset = set(range(num_points, num_vert))
-    coloring = [set(range(num_points)), set(range(num_points,num_vert))]
+    if point_coloring == None:
+        point_coloring = [set(range(num_points))]
+    coloring = point_coloring + [set(range(num_points,num_vert))]
     
     adj_dict = {}
     for i in range(num_vert):
@@ -138,15 +228,245 @@ def make_bipartite_for_design_linelist(num_points, line_list):
 
     return g
 
+"""
+Certificates of designs, as used for isomorph rejection. Rather than building a
+new graph for each design as make_bipartite_for_design does, one pynauty Graph
+is kept for each shape (number of points, number of lines), with its coloring
+set once, and for each design it is given just the adjacency lists of its line
+vertices with set_adjacency_dict. pynauty adds the edges back from the points
+to the lines itself, and nauty's certificate only depends on the graph and the
+ordered coloring, so the certificates are those of make_bipartite_for_design.
+check_certificates compares the two on some stored designs.
+"""
+# number of designs certified between checks for duplicates in 
+# enumerate_saturations and all_full_completions
+CERTIFICATE_BATCH = 256
+
+_certificate_graphs = {}
+# the list of points of each line bitmask seen so far
+_mask_points = {}
+
+# the shared graph of designs with npoints points and num_lines lines
+def certificate_graph(npoints, num_lines):
+    key = (npoints, num_lines)
+    if key not in _certificate_graphs:
+        _certificate_graphs[key] = pynauty.Graph(npoints + num_lines, 
+            vertex_coloring = [set(range(npoints)), 
+                set(range(npoints, npoints + num_lines))])
+    return _certificate_graphs[key]
+
+# certificates of a batch of designs on npoints points, each a list of lines
+def certificates_linelist(npoints, line_lists):
+    certs = []
+    for line_list in line_lists:
+        g = certificate_graph(npoints, len(line_list))
+        # pynauty requires lists
+        g.set_adjacency_dict({npoints + li: list(line) 
+            for li, line in enumerate(line_list)})
+        certs.append(pynauty.certificate(g))
+    metrics.count("certificates", len(certs))
+    return certs
+
+# certificates of a batch of designs on npoints points, each a list of line 
+# bitmasks
+def certificates_masks(npoints, mask_lists):
+    certs = []
+    for masks in mask_lists:
+        g = certificate_graph(npoints, len(masks))
+        adj = {}
+        for li, mask in enumerate(masks):
+            if mask not in _mask_points:
+                _mask_points[mask] = list(mask_line(mask))
+            adj[npoints + li] = _mask_points[mask]
+        g.set_adjacency_dict(adj)
+        certs.append(pynauty.certificate(g))
+    metrics.count("certificates", len(certs))
+    return certs
+
+# whether certificates_linelist and certificates_masks give the certificates of
+# make_bipartite_for_design for each of the designs pds
+def check_certificates(pds):
+    for pd in pds:
+        expected = pynauty.certificate(make_bipartite_for_design(pd))
+        line_list = [sorted(line) for line in pd.lines]
+        masks = [line_mask(line) for line in pd.lines]
+        if certificates_linelist(pd.num_points, [line_list]) != [expected] or \
+                certificates_masks(pd.num_points, [masks]) != [expected]:
+            return False
+    return True
+
+# split an iterable into lists of size items, the last possibly shorter
+def batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
 # creates a unique identifier has for a partial design
 # used for isomorphism testing
 def make_identifier_hash(pd):
-    return pynauty.certificate(make_bipartite_for_design(pd))
+    return certificates_linelist(pd.num_points, [pd.lines])[0]
 
 
 def make_identifier_hash_linelist(npoints, line_list):
-    return pynauty.certificate(make_bipartite_for_design_linelist(npoints, line_list))
+    return certificates_linelist(npoints, [line_list])[0]
+
+"""
+Helpers for the canonical augmentation mode (canonical = True) of the search.
+Rather than remembering the certificate of every design seen so far, a design 
+is kept only if the step that produced it is the canonical way of producing it 
+(McKay's canonical augmentation). Only local information is needed, so memory 
+does not grow with the number of designs found, and independent searches do not
+share any state.
+"""
 
+# the marked line of a seed: the initial line, which passes through 0 and 1
+def marked_line(pd):
+    for l in pd.lines:
+        if l[0] == 0 and l[1] == 1:
+            return l
+
+# certificate of a seed, with the points of its marked line colored so that 
+# isomorphisms must map the marked line to itself
+def make_seed_hash(npoints, line_list, marked):
+    coloring = [set(marked), set(range(npoints)) - set(marked)]
+    metrics.count("certificates")
+    return pynauty.certificate(
+        make_bipartite_for_design_linelist(npoints, line_list, coloring))
+
+# pick one line from each orbit of lines under the group with the given 
+# generators. The set of lines must be closed under the group.
+def line_orbit_representatives(lines, generators):
+    index = {l: i for i, l in enumerate(lines)}
+    seen = [False for l in lines]
+    representatives = []
+    for i, l in enumerate(lines):
+        if seen[i]:
+            continue
+        seen[i] = True
+        representatives.append(l)
+        todo = [l]
+        while todo:
+            line = todo.pop()
+            for gen in generators:
+                image = tuple(sorted(gen[p] for p in line))
+                j = index[image]
+                if not seen[j]:
+                    seen[j] = True
+                    todo.append(image)
+    return representatives
+
+# Canonical test for adding the last line of pd, a line of length line_len 
+# through pt_on. The lines that could have been added last are those of length 
+# line_len starting at pt_on, other than the initial line (lines through earlier
+# points were added before). Accept if the last line is in the same orbit as the
+# first of them in the canonical labelling.
+def is_canonical_line_extension(pd, pt_on, line_len, coloring, initial_line):
+    n = pd.num_points
+    g = make_bipartite_for_design_linelist(n, pd.lines, coloring)
+    metrics.count("automorphism_groups")
+    metrics.count("certificates")
+    orbits = pynauty.autgrp(g)[3]
+    for v in pynauty.canon_label(g):
+        if v >= n and pd.lines[v-n][0] == pt_on and \
+                len(pd.lines[v-n]) == line_len and \
+                pd.lines[v-n] != initial_line:
+            return orbits[v] == orbits[n + len(pd.lines) - 1]
+
+# Canonical test for a finished seed, whose points 0, ..., num_saturated-1 are 
+# saturated, and which has a marked line on points 0, ..., marked_len-1. The 
+# search tells these points apart, but seeds only need to be distinct up to 
+# isomorphisms preserving the saturated points and the marked line as sets. So
+# accept the seed only if relabelling those points in canonical order gives an
+# isomorphic labelled seed.
+def is_canonical_seed(pd, num_saturated, marked_len):
+    n = pd.num_points
+    sets_coloring = [set(range(num_saturated)), 
+        set(range(num_saturated, marked_len)), set(range(marked_len, n))]
+    # a canonical labelling and two certificates
+    metrics.count("certificates", 3)
+    lab = pynauty.canon_label(
+        make_bipartite_for_design_linelist(n, pd.lines, sets_coloring))
+
+    relabel = list(range(n))
+    sat_order = [v for v in lab if v < num_saturated]
+    rest_order = [v for v in lab if num_saturated <= v < marked_len]
+    for i, v in enumerate(sat_order + rest_order):
+        relabel[v] = i
+    relabelled = [tuple(sorted(relabel[p] for p in l)) for l in pd.lines]
+
+    points_coloring = [set([p]) for p in range(marked_len)] + \
+        [set(range(marked_len, n))]
+    return pynauty.certificate(make_bipartite_for_design_linelist(
+            n, pd.lines, points_coloring)) == \
+        pynauty.certificate(make_bipartite_for_design_linelist(
+            n, relabelled, points_coloring))
+
+# Canonical test for a design obtained by saturating point_saturate, the last 
+# unsaturated point on the marked line. Accept if point_saturate is in the orbit
+# of the first marked point in the canonical labelling, with the marked line 
+# colored.
+def is_canonical_saturation(npoints, line_list, marked, point_saturate):
+    coloring = [set(marked), set(range(npoints)) - set(marked)]
+    g = make_bipartite_for_design_linelist(npoints, line_list, coloring)
+    metrics.count("automorphism_groups")
+    metrics.count("certificates")
+    orbits = pynauty.autgrp(g)[3]
+    for v in pynauty.canon_label(g):
+        if v in marked:
+            return orbits[v] == orbits[point_saturate]
+
+# Canonical test for a full design grown from a seed whose marked line is 
+# marked, with seed certificate seed_h (see make_seed_hash). The design is 
+# accepted only from the seed made by the lines meeting its canonical shortest 
+# line, so that every design comes from exactly one seed.
+def is_canonical_completion(npoints, line_list, marked, seed_h):
+    if min(len(l) for l in line_list) != len(marked):
+        return False
+    metrics.count("certificates")
+    lab = pynauty.canon_label(
+        make_bipartite_for_design_linelist(npoints, line_list))
+    for v in lab:
+        if v >= npoints and len(line_list[v-npoints]) == len(marked):
+            canonical_line = line_list[v-npoints]
+            break
+    if canonical_line == marked:
+        return True
+    seed_lines = [l for l in line_list if set(canonical_line).intersection(l)]
+    return make_seed_hash(npoints, seed_lines, canonical_line) == seed_h
+
+
+"""
+Symmetry pruning for the exact cover stage. Solutions that differ by an 
+automorphism of the seed are isomorphic, so for the first column chosen by the
+solver it is enough to try one covering line from each orbit of the 
+automorphisms of the seed fixing that column.
+ - psol: the seed being extended
+ - column_points: for each exact cover column, the points it stands for 
+ - row_lines: for each exact cover row, its line
+ - fixed_classes: list of sets of points every automorphism used must preserve
+Returns a prune_root function for the solvers in solve_exact_cover.
+"""
+def make_symmetry_pruner(psol, column_points, row_lines, fixed_classes):
+    n = psol.num_points
+    def prune_root(c, rows):
+        col_pts = set(column_points[c])
+        rest = set(range(n)) - col_pts
+        for s in fixed_classes:
+            rest -= s
+        coloring = [s - col_pts for s in fixed_classes] + [col_pts, rest]
+        metrics.count("automorphism_groups")
+        generators = pynauty.autgrp(make_bipartite_for_design_linelist(n, 
+            psol.lines, coloring))[0]
+        if len(generators) == 0:
+            return rows
+        row_of_line = {row_lines[r]: r for r in rows}
+        representatives = line_orbit_representatives(
+            [row_lines[r] for r in rows], generators)
+        return [row_of_line[l] for l in representatives]
+    return prune_root
 
 """
 make a list containing all possible lines in n vertices, up to length maxlen
@@ -181,6 +501,64 @@ def make_all_lines(n, maxlen = None):
 
     return all_lines_with_len, lines_through_each_with_len
 
+"""
+Immutable tables of lines on n points, built once per process by 
+get_line_tables and shared by every search on n points (Pool workers started
+by fork inherit them). Lines go up to length n//2 + 1, the longest any search 
+uses.
+ - all_lines_with_len, lines_through_each_with_len: as returned by 
+   make_all_lines, with tuples in place of lists
+ - masks_with_len[l]: uint64 array with the bitmask of each line in 
+   all_lines_with_len[l]
+ - masks_through_each_with_len[p][l]: likewise for lines_through_each_with_len
+ - pair_index[i][j]: index of the pair {i, j} in the list of all pairs i < j
+ - pairs_with_len[l]: array with a row for each line of length l, holding the
+   pair indices of the pairs on that line
+"""
+# uint64 array of the bitmasks of a list of lines
+def line_masks_array(lines):
+    return np.array([line_mask(l) for l in lines], dtype=np.uint64)
+
+LineTables = collections.namedtuple("LineTables", ["all_lines_with_len", 
+    "lines_through_each_with_len", "masks_with_len", 
+    "masks_through_each_with_len", "pair_index", "pairs_with_len"])
+
+_line_tables = {}
+
+def get_line_tables(n):
+    if n in _line_tables:
+        return _line_tables[n]
+
+    maxlen = n//2 + 1
+    all_lines_with_len, lines_through_each_with_len = make_all_lines(n, maxlen)
+    all_lines_with_len = {l: tuple(lines) 
+        for l, lines in all_lines_with_len.items()}
+    lines_through_each_with_len = [{l: tuple(lines) for l, lines in d.items()}
+        for d in lines_through_each_with_len]
+
+    masks_with_len = {l: line_masks_array(lines)
+        for l, lines in all_lines_with_len.items()}
+    masks_through_each_with_len = [
+        {l: line_masks_array(lines) for l, lines in d.items()}
+        for d in lines_through_each_with_len]
+
+    pair_index = [[None for j in range(n)] for i in range(n)]
+    for k, (i, j) in enumerate(itertools.combinations(range(n), 2)):
+        pair_index[i][j] = k
+        pair_index[j][i] = k
+    pairs_with_len = {}
+    for l, lines in all_lines_with_len.items():
+        pairs = np.zeros((len(lines), l*(l-1)//2), dtype=np.int64)
+        for li, line in enumerate(lines):
+            pairs[li] = [pair_index[i][j] 
+                for i, j in itertools.combinations(line, 2)]
+        pairs_with_len[l] = pairs
+
+    _line_tables[n] = LineTables(all_lines_with_len, 
+        lines_through_each_with_len, masks_with_len, 
+        masks_through_each_with_len, pair_index, pairs_with_len)
+    return _line_tables[n]
+
 """
 Rewriting of function "find_all_seeds2" from prior version
 Finds all nonisomorphic ways to add all lines through some initial set of points
@@ -188,8 +566,21 @@ Finds all nonisomorphic ways to add all lines through some initial set of points
  - maxlen: maximum line length to consider
  - initial_len: length of line to find seeds from. 
  - All lines will have at least this length
+The search is depth first on a single partial design: a line is added in place,
+the branch containing it is explored, and then the line is removed again.
+ - canonical: use canonical augmentation instead of a set of known hashes. 
+   Seeds are then distinct up to isomorphisms preserving the saturated points 
+   and the initial line (as sets), as needed by the canonical modes of 
+   enumerate_saturations and all_full_completions.
+ - frontier_depth: if given, do not search past branches with this many lines
+   added to the initial line. Instead return the list of ("seed", lines) and 
+   ("branch", lines, state) entries met by the search, in search order.
+ - start: a (lines, state) pair from a "branch" entry, to search only that 
+   branch. Used to split the search between processes, see 
+   find_all_seeds_multithreaded.
 """
-def find_all_seeds(npoints, initial_len, pt_up_to, verbose=True):
+def find_all_seeds(npoints, initial_len, pt_up_to, verbose=True, 
+        canonical=False, frontier_depth=None, start=None):
     min_line_len = initial_len
     maxlen = npoints//2 + 1
 
@@ -198,149 +589,174 @@ def find_all_seeds(npoints, initial_len, pt_up_to, verbose=True):
             "initial_len = {}").format(npoints, maxlen, initial_len))
 
     if verbose: print("Initializing lines")
-    all_lines_with_len, lines_through_each_with_len = make_all_lines(npoints)
+    lines_through_each_with_len = \
+        get_line_tables(npoints).lines_through_each_with_len
     initial_line = range(initial_len)
     if verbose: print("Finished intializing")
 
-    
-
     # base partial design, consisting of only the base line
-    base_pd = PartialDesign(npoints, [initial_line]) 
-    base_h = make_identifier_hash(base_pd)
-
-    # five values: partial design, hash, point on, line length on, option on
-    # each stack entry is a breadth first search branch to explore
-    look_at_stack = [{"pd" : base_pd, 
-                     "hash" : base_h,
-                     "pt_on" : 0, 
-                     "length_on": maxlen,
-                     "option_on": 0}]
+    pd = PartialDesign(npoints, [initial_line] if start == None else start[0])
+    base_h = make_identifier_hash(pd)
 
     completed_stack = [] # completed designs, to return at end
+    frontier = [] # seeds and unexplored branches, if frontier_depth is given
     known_hashes = set([(base_h)]) # design hashes that have appeared so far
+    run = [0] # run on, in a list so that the nested search can update it
+
+    # explore the branch in which pd has all lines chosen so far, and the next
+    # candidate is option option_on of the lines of length line_len_on through 
+    # pt_on. Lines are added to pd before recursing and removed afterwards, so 
+    # pd is unchanged when this returns.
+    def search(pt_on, line_len_on, option_on):
+        while True:
+            # logging info
+            if verbose and run[0] % 10000 == 0:
+                print("\nOn run:", run[0], ", depth:", len(pd.lines), 
+                    ",  solutions found:", len(completed_stack))
+            run[0] += 1
+            metrics.count("seed_nodes")
+
+            # if pt_on is after the initial line, record design and terminate 
+            # this branch
+            if pt_on == pt_up_to:
+                completed_stack.append(pd.copy())
+                frontier.append(("seed", list(pd.lines)))
+                return
+
+            if pd.is_saturated(pt_on): # point all filled up
+                pt_on, line_len_on, option_on = pt_on+1, maxlen, 0
+                continue
 
-    run = 0 # run on 
-
-    # while there are search brancehs to explore, pop them and keep exploring
-    while len(look_at_stack) > 0:
-        search_entry = look_at_stack.pop(0)
-        pd = search_entry["pd"]
-        pd_h = search_entry["hash"]
-        pt_on = search_entry["pt_on"]
-        line_len_on = search_entry["length_on"]
-        option_on = search_entry["option_on"]
-
-        nlines = len(pd.lines)
-
-        # logging info
-        if verbose and run >= 0 and run % 10000 == 0:
-            print("\nOn run:", run, ", in queue:", len(look_at_stack), 
-                ",  solutions found:", len(completed_stack))
-            print("num lines =", nlines, ", lines:")
-            for l in pd.lines:
-                print(l)
-
-        # if pt_on is after the initial line, add design to stack and 
-        # terminate this branch
-        if pt_on == pt_up_to:
-            completed_stack.append(pd)
-            continue
-
-        # number of lines passing through each point in configuration
-        pts_connected = np.sum(pd.has_line, axis = 1)
-
-        if pts_connected[pt_on] == pd.num_points - 1: # point all filled up
-            look_at_stack.append({
-                "pd": pd,
-                "hash": pd_h, 
-                "pt_on": pt_on+1,
-                "length_on": maxlen,
-                "option_on" : 0})
-            continue
+            # try adding all lines through pt_on
+            candidate_lines = lines_through_each_with_len[pt_on][line_len_on]
 
-        # try adding all lines through pt_on
-        candidate_lines = lines_through_each_with_len[pt_on][line_len_on]
+            # exhausted options, decrease line length
+            if option_on == len(candidate_lines): 
+                if line_len_on > min_line_len:
+                    line_len_on, option_on = line_len_on-1, 0
+                    continue
+                return
+
+            chosen_line = candidate_lines[option_on]
+
+            # if we can add the chosen line, explore the branch with it first,
+            # then continue this loop as the branch without it
+            if pd.can_add(chosen_line):
+                pd.add_line(chosen_line)
+                h = make_identifier_hash(pd)
+                if h not in known_hashes:
+                    known_hashes.add(h)
+                    if at_frontier():
+                        frontier.append(("branch", list(pd.lines), 
+                            (pt_on, line_len_on, option_on+1)))
+                    else:
+                        search(pt_on, line_len_on, option_on+1)
+                else:
+                    metrics.count("duplicates")
+                pd.remove_line(chosen_line)
+            else:
+                metrics.count("lines_rejected")
+
+            option_on += 1
+
+    # points of the initial line are told apart, the other points are not
+    coloring = [set([p]) for p in range(initial_len)] + \
+        [set(range(initial_len, npoints))]
+
+    # canonical augmentation version of search: from pd, add one line of 
+    # length line_len_on through pt_on for each orbit of such lines under the
+    # automorphisms of pd, and keep it if it passes the canonical test
+    def search_canonical(pt_on, line_len_on):
+        while True:
+            if verbose and run[0] % 10000 == 0:
+                print("\nOn run:", run[0], ", depth:", len(pd.lines), 
+                    ",  solutions found:", len(completed_stack))
+            run[0] += 1
+            metrics.count("seed_nodes")
+
+            if pt_on == pt_up_to:
+                if is_canonical_seed(pd, pt_up_to, initial_len):
+                    completed_stack.append(pd.copy())
+                    frontier.append(("seed", list(pd.lines)))
+                return
+
+            if pd.is_saturated(pt_on): # point all filled up
+                pt_on, line_len_on = pt_on+1, maxlen
+                continue
 
-        # exhausted options, decrease line length
-        if option_on == len(candidate_lines): 
+            candidate_lines = [l for l in 
+                lines_through_each_with_len[pt_on][line_len_on] 
+                if pd.can_add(l)]
+            metrics.count("lines_rejected", len(
+                lines_through_each_with_len[pt_on][line_len_on]) - 
+                len(candidate_lines))
+
+            if len(candidate_lines) > 0:
+                metrics.count("automorphism_groups")
+                generators = pynauty.autgrp(make_bipartite_for_design_linelist(
+                    npoints, pd.lines, coloring))[0]
+                for l in line_orbit_representatives(candidate_lines, 
+                        generators):
+                    pd.add_line(l)
+                    if is_canonical_line_extension(pd, pt_on, line_len_on, 
+                            coloring, tuple(initial_line)):
+                        if at_frontier():
+                            frontier.append(("branch", list(pd.lines), 
+                                (pt_on, line_len_on)))
+                        else:
+                            search_canonical(pt_on, line_len_on)
+                    pd.remove_line(l)
+
+            # then continue with the lines of the next length
             if line_len_on > min_line_len:
-                look_at_stack.append({
-                    "pd": pd, 
-                    "hash": pd_h, 
-                    "pt_on": pt_on, 
-                    "length_on": line_len_on-1, 
-                    "option_on": 0})
-            continue
-
-        chosen_line = candidate_lines[option_on]
-
-        # if we can add the chosen line, do so
-        if pd.can_add(chosen_line):
-            # first push command to remove line and proceed without this line
-            pd.add_line(chosen_line)
-            h = make_identifier_hash(pd)
-            pd.remove_line(chosen_line)
-
-            if h not in known_hashes:
-                known_hashes.add(h)
-                new_pd = copy.deepcopy(pd)
-                new_pd.add_line(chosen_line)
-                branch_with_newline = {
-                    "pd": new_pd, 
-                    "hash": h, 
-                    "pt_on": pt_on, 
-                    "length_on": line_len_on, 
-                    "option_on": option_on+1}
-                look_at_stack.append(branch_with_newline)
-
-            # then push command to add this line and proceed with it
-            branch_no_newline = {
-                "pd": pd, 
-                "hash": pd_h, 
-                "pt_on": pt_on, 
-                "length_on": line_len_on, 
-                "option_on": option_on+1}
-
-            look_at_stack.insert(0, branch_no_newline) # insert at front
-
-        # if we can't add the chosen line, go to next option
-        else:
-            # neither add nor remove lime
-            command = {
-                "pd": pd, 
-                "hash": pd_h, 
-                "pt_on": pt_on, 
-                "length_on": line_len_on, 
-                "option_on": option_on+1}
+                line_len_on -= 1
+                continue
+            return
 
-            look_at_stack.insert(0, command) # insert at front
+    # True if branches from pd should be returned rather than searched
+    def at_frontier():
+        return frontier_depth != None and len(pd.lines) - 1 >= frontier_depth
 
-        run += 1
+    if canonical:
+        search_canonical(*(start[1] if start != None else (0, maxlen)))
+    else:
+        search(*(start[1] if start != None else (0, maxlen, 0)))
 
     if verbose: print("Finished with:", len(completed_stack), " solutions!")
+    if frontier_depth != None:
+        return frontier
     return completed_stack
 
 # given a partial design, find all ways to add lines such that a specified point
 # contains a complete pencil
-def enumerate_saturations(psol, point_saturate, known_hashes = set([])):
+# cover_backend names the exact cover solver to use, see EXACT_COVER_BACKENDS
+# with canonical = True, psol should be a seed from find_all_seeds in canonical 
+# mode, and point_saturate the last unsaturated point on its marked line. 
+# Results are then kept by a canonical test instead of known_hashes, which is 
+# not used.
+# with symmetry_pruning = True, the search skips solutions equivalent under the
+# automorphisms of psol, see make_symmetry_pruner
+# with_hashes = True returns (certificate, design) pairs instead of designs
+def enumerate_saturations(psol, point_saturate, known_hashes = set([]), 
+        cover_backend = "algx", canonical = False, symmetry_pruning = False,
+        with_hashes = False):
     n  = psol.num_points
     maxlen = n//2 + 1
 
-    # make relevant lines 
-    # note: if necessary, we can get a speed up by moving this to 
-    # `enumerate_full_solutions' function)
-    all_lines_with_len, lines_through_each_with_len = make_all_lines(n)
+    # relevant lines, shared by all calls on n points
+    tables = get_line_tables(n)
 
     pts_to_cover = [i for i in range(n) if \
-    i != point_saturate and psol.has_line[point_saturate, i] == False]
+    i != point_saturate and not psol.is_connected(point_saturate, i)]
+    cover_index = {j: pind for pind, j in enumerate(pts_to_cover)}
 
     underlying_set = set(range(len(pts_to_cover)))
     valid_lines = []
     for l in range(3, maxlen+1):
-        choices = lines_through_each_with_len[point_saturate][l]
-        for c in choices:
-            if psol.can_add(c):
-                valid_lines.append(c)  
+        choices = tables.lines_through_each_with_len[point_saturate][l]
+        masks = tables.masks_through_each_with_len[point_saturate][l]
+        for i in np.flatnonzero(psol.can_add_masks(masks)):
+            valid_lines.append(choices[i])
 
     # Y is the set of covering sets
     Y = {}
@@ -350,173 +766,539 @@ def enumerate_saturations(psol, point_saturate, known_hashes = set([])):
             if j == point_saturate:
                 continue
             else:
-                pind = pts_to_cover.index(j)
-                Y[i].append(pind)
+                Y[i].append(cover_index[j])
 
     # X1 and Y1 are disctionaries on which we an run algorithm X
     X1, Y1 = make_inputs(underlying_set, Y)
     all_saturations = []
 
-    for s in solve(X1, Y1):
-        add_lines = [valid_lines[j] for j in s]
-        h = make_identifier_hash_linelist(n, psol.lines + add_lines)
-        if h not in known_hashes:
+    if canonical:
+        # only isomorphic saturations of this seed need to be told apart
+        marked = marked_line(psol)
+        known_hashes = set([])
+
+    prune_root = None
+    if symmetry_pruning:
+        # automorphisms must fix point_saturate, and the marked line in 
+        # canonical mode
+        fixed_classes = [set([point_saturate])]
+        if canonical:
+            fixed_classes.append(set(marked) - set([point_saturate]))
+        prune_root = make_symmetry_pruner(psol, 
+            [[p] for p in pts_to_cover], valid_lines, fixed_classes)
+
+    solutions = ([valid_lines[j] for j in s] for s in 
+        EXACT_COVER_BACKENDS[cover_backend](X1, Y1, prune_root = prune_root))
+    if canonical:
+        solutions = (add_lines for add_lines in solutions if 
+            is_canonical_saturation(n, psol.lines + add_lines, marked, 
+                point_saturate))
+
+    for batch in batches(solutions, CERTIFICATE_BATCH):
+        if canonical:
+            hashes = [make_seed_hash(n, psol.lines + add_lines, marked) 
+                for add_lines in batch]
+        else:
+            hashes = certificates_linelist(n, 
+                [psol.lines + add_lines for add_lines in batch])
+        for add_lines, h in zip(batch, hashes):
+            # known_hashes may be a set or a certificate store, and one add 
+            # both checks and records h
+            num_known = len(known_hashes)
             known_hashes.add(h)
-            new_pd = copy.deepcopy(psol)
-            for l in add_lines:
-                new_pd.add_line(l)
-            # print("num total full sol:", len(known_hashes_full))
-            all_saturations.append(new_pd)
+            if len(known_hashes) > num_known:
+                new_pd = psol.copy()
+                for l in add_lines:
+                    new_pd.add_line(l)
+                all_saturations.append((h, new_pd) if with_hashes else new_pd)
+            else:
+                metrics.count("duplicates")
     return all_saturations
 
-def all_full_completions(psol, known_hashes_full = None, minlen = 3):
-    if known_hashes_full == None:
+# with canonical = True, psol should be a seed made in canonical mode, and a 
+# completion is kept only if psol is its canonical seed. known_hashes_full is 
+# then only used for completions of psol itself.
+# symmetry_pruning is as in enumerate_saturations
+# with_hashes = True returns (certificate, design) pairs instead of designs
+def all_full_completions(psol, known_hashes_full = None, minlen = 3, 
+        cover_backend = "algx", canonical = False, symmetry_pruning = False,
+        with_hashes = False):
+    if known_hashes_full == None or canonical:
         known_hashes_full = set([])
     n  = psol.num_points
     maxlen = n//2 + 1
 
-    # make relevant lines 
-    # note: if necessary, we can get a speed up by moving this to 
-    # `enumerate_full_solutions' function)
-    all_lines_with_len, lines_through_each_with_len = make_all_lines(n)
+    # relevant lines, shared by all calls on n points
+    tables = get_line_tables(n)
 
     all_pairs = []
+    # column of each pair in the exact cover problem, -1 if not a column
+    pair_column = [-1 for k in range(n*(n-1)//2)]
     # add all pairs that don't already have a line
     for i in range(2,n):
         for j in range(i+1,n):
-            if not psol.has_line[i,j]:
+            if not psol.is_connected(i, j):
+                pair_column[tables.pair_index[i][j]] = len(all_pairs)
                 all_pairs.append((i,j))
     underlying_set = set(range(len(all_pairs)))
 
+    pair_column = np.array(pair_column, dtype=np.int64)
+
+    # filter the lines of each length all at once, then look up the columns of
+    # the pairs on the valid lines
+    # (pairs through points 0 and 1 are skipped, they are not columns)
     valid_lines = []
+    valid_columns = []
     for l in range(minlen, maxlen+1):
-        choices = all_lines_with_len[l]
-        for c in choices:
-            if psol.can_add(c):
-                valid_lines.append(c)  
+        choices = tables.all_lines_with_len[l]
+        valid = np.flatnonzero(psol.can_add_masks(tables.masks_with_len[l]))
+        columns = pair_column[tables.pairs_with_len[l][valid]]
+        for i, cols in zip(valid, columns):
+            valid_lines.append(choices[i])
+            valid_columns.append(cols[cols != -1])
 
     # Y is the set of covering sets
     Y = {}
-    for i,l in enumerate(valid_lines):
-        Y[i] = []
-        for i1 in l:
-            for i2 in l:
-                if i1 >= i2:
-                    continue
-                if i1 <= 1 or i2 <= 1:
-                    continue
-                pind = all_pairs.index((i1,i2))
-                # print(i, l, i1, i2, pind)
-                Y[i].append(pind)
+    for i, cols in enumerate(valid_columns):
+        Y[i] = cols.tolist()
 
     # X1 and Y1 are disctionaries on which we an run algorithm X
     X1, Y1 = make_inputs(underlying_set, Y)
     all_completions = []
-    for s in solve(X1, Y1):
-        add_lines = [valid_lines[j] for j in s]
-        h = make_identifier_hash_linelist(n, psol.lines + add_lines)
-        if h not in known_hashes_full:
+    if canonical:
+        marked = marked_line(psol)
+        seed_h = make_seed_hash(n, psol.lines, marked)
+
+    prune_root = None
+    if symmetry_pruning:
+        fixed_classes = [set(marked)] if canonical else []
+        prune_root = make_symmetry_pruner(psol, all_pairs, valid_lines, 
+            fixed_classes)
+
+    solutions = ([valid_lines[j] for j in s] for s in 
+        EXACT_COVER_BACKENDS[cover_backend](X1, Y1, prune_root = prune_root))
+    if canonical:
+        solutions = (add_lines for add_lines in solutions if 
+            is_canonical_completion(n, psol.lines + add_lines, marked, seed_h))
+
+    for batch in batches(solutions, CERTIFICATE_BATCH):
+        hashes = certificates_linelist(n, 
+            [psol.lines + add_lines for add_lines in batch])
+        for add_lines, h in zip(batch, hashes):
+            num_known = len(known_hashes_full)
             known_hashes_full.add(h)
-            new_pd = copy.deepcopy(psol)
-            for l in add_lines:
-                new_pd.add_line(l)
-            # print("num total full sol:", len(known_hashes_full))
-            all_completions.append(new_pd)
+            if len(known_hashes_full) > num_known:
+                new_pd = psol.copy()
+                for l in add_lines:
+                    new_pd.add_line(l)
+                all_completions.append((h, new_pd) if with_hashes else new_pd)
+            else:
+                metrics.count("duplicates")
     return all_completions
 
-def find_all_completions_multithreaded(seeds, batchsize=1000):
-    p = Pool(multiprocessing.cpu_count())
-    # print("Finding all completions using multithreading")
-    known_completions = {}
-    for i in range(0, len(seeds), batchsize):
-        batch = seeds[i:(i+batchsize)]
-        completions_indiv = p.map(all_full_completions, batch)
-        all_comp = []
-        for c in completions_indiv:
-            all_comp += c
-        for s in all_comp:
-            known_completions[make_identifier_hash(s)] = s
+# memory budget in bytes for the certificates kept by a stage, or None to keep
+# them in a dict. With a budget they are kept in a CertificateStore, which 
+# moves them to disk past the budget, at tens of times the cost of a dict per
+# certificate.
+CERTIFICATE_MEMORY = None
 
-        print("Finished batch {}/{} with {} seeds, found {} solutions, {} sol total".\
-            format(i//batchsize, len(seeds)//batchsize, batchsize, 
-                len(all_comp), len(known_completions)))
-
-    return list(known_completions.values())
+# the store of the certificates seen by a stage, giving each an id
+def new_certificate_store():
+    if CERTIFICATE_MEMORY == None:
+        return KeyIds()
+    return CertificateStore(memory_budget = CERTIFICATE_MEMORY)
 
+"""
+Worker tasks for the multithreaded stages. Each takes an (index, item) pair and
+returns the index with a list of compact (certificate, line masks) records, so 
+that neither PartialDesign objects nor a second certificate computation are 
+needed in the parent process, and the worker's metrics.take_delta().
+"""
+# completions of a seed
+def completion_records(indexed_seed, **kwargs):
+    i, seed = indexed_seed
+    records = [(h, tuple(line_mask(l) for l in pd.lines)) 
+        for h, pd in all_full_completions(seed, with_hashes = True, **kwargs)]
+    return i, records, metrics.take_delta()
+
+# saturations of a seed
+def saturation_records(indexed_seed, point_saturate, **kwargs):
+    i, seed = indexed_seed
+    records = [(h, tuple(line_mask(l) for l in pd.lines)) 
+        for h, pd in enumerate_saturations(seed, point_saturate, set([]), 
+            with_hashes = True, **kwargs)]
+    return i, records, metrics.take_delta()
+
+# seeds from an entry of the frontier returned by find_all_seeds. In canonical
+# mode the seeds are already distinct, and are keyed by their lines.
+def seed_records(indexed_entry, npoints, initial_len, pt_up_to, canonical):
+    i, entry = indexed_entry
+    if entry[0] == "seed":
+        seeds = [PartialDesign(npoints, entry[1])]
+    else:
+        seeds = find_all_seeds(npoints, initial_len, pt_up_to, verbose = False,
+            canonical = canonical, start = entry[1:])
+    all_masks = [tuple(line_mask(l) for l in pd.lines) for pd in seeds]
+    keys = all_masks if canonical else certificates_masks(npoints, all_masks)
+    return i, list(zip(keys, all_masks)), metrics.take_delta()
+
+# run a worker task on a chunk of items
+def run_task_chunk(task, chunk):
+    return [task(item) for item in chunk]
+
+# run task on each of items on the pool p, in chunks of chunksize, with at most
+# max_in_flight items handed out but not yet finished, and yield the results as
+# they finish. The chunks are handed out from this thread rather than from a 
+# generator run by the pool's own threads, so that an exception in a worker or 
+# a KeyboardInterrupt is raised here, and the pool can still be terminated.
+def stream_pool_tasks(p, task, items, chunksize, max_in_flight):
+    items = iter(items)
+    finished = queue.Queue()
+    max_chunks = max(1, max_in_flight // chunksize)
+    num_chunks = 0
+    while True:
+        while num_chunks < max_chunks:
+            chunk = list(itertools.islice(items, chunksize))
+            if not chunk:
+                break
+            p.apply_async(run_task_chunk, (task, chunk), 
+                callback = finished.put, error_callback = finished.put)
+            num_chunks += 1
+        if num_chunks == 0:
+            return
+        results = finished.get()
+        num_chunks -= 1
+        if isinstance(results, BaseException):
+            raise results
+        for result in results:
+            yield result
 
-# Enumerate all Sylvester-Gallai designs on npoints points with minimum line 
-# length 3. 
-def enumerate_full_solutions_min3(npoints, multithreaded = False):
-    print(("Finding Sylvester-Gallai designs on {} points " + 
-        "with min length three").format(npoints))
-    maxlen = npoints // 2 + 1
+"""
+Run a worker task over a list of items on a process pool, and merge the records
+it returns by certificate. Items are streamed to the workers in chunks of 
+chunksize, with at most max_in_flight items handed out but not yet finished, so
+that no core waits for a batch to finish and memory stays bounded. Among 
+records with the same certificate the one from the earliest item is kept, so 
+the result is the same as running the items in order on one core.
+ - n: number of points of the designs
+ - label: name of the items in progress messages
+ - batchsize: number of finished items between progress messages
+ - known: the store giving ids to the certificates, by default 
+   new_certificate_store(). KeyIds is used for records keyed by something 
+   else.
+ - checkpoint, stage: if a checkpoint is given, the records changing the kept
+   designs are logged to it under stage as each item finishes, and the items
+   logged by an interrupted run are not run again.
+Returns the kept designs, in order of item, or (certificate, design) pairs if
+with_hashes is True.
+"""
+def merge_records_multithreaded(task, items, n, label = "seeds", 
+        batchsize = 1000, chunksize = 4, max_in_flight = None, 
+        with_hashes = False, known = None, checkpoint = None, stage = None):
+    nprocs = multiprocessing.cpu_count()
+    if max_in_flight == None:
+        max_in_flight = 4 * chunksize * nprocs
+    max_in_flight = max(max_in_flight, chunksize)
+
+    # build the line tables before forking, so that workers inherit them
+    get_line_tables(n)
+
+    own_store = known == None
+    if own_store:
+        known = new_certificate_store()
+
+    # by certificate id, ((item index, position), line masks, certificate) of 
+    # the kept design. The certificate is only kept if with_hashes is True.
+    known_records = []
+    # merge a record, and return "new" if its certificate was not known, 
+    # "earlier" if it replaced a record from a later item, or None
+    def merge_record(i, pos, h, masks):
+        record = ((i, pos), masks, h if with_hashes else None)
+        cert_id = known.add(h)
+        if cert_id == len(known_records):
+            known_records.append(record)
+            return "new"
+        if known_records[cert_id][0] > (i, pos):
+            known_records[cert_id] = record
+            return "earlier"
+        return None
+
+    # replaying the logged records in order gives the same kept designs, as 
+    # the records not logged did not change them
+    finished = set()
+    if checkpoint != None:
+        finished, logged = checkpoint.load_items(stage)
+        for i, pos, h, masks in logged:
+            merge_record(i, pos, h, masks)
+        if len(finished) > 0:
+            print("Resuming {} after {}/{} finished {}, {} designs".format(
+                stage, len(finished), len(items), label, len(known_records)))
+
+    num_done = len(finished)
+    todo = ((i, item) for i, item in enumerate(items) if i not in finished)
+    with metrics.stage("pool"), Pool(nprocs) as p:
+        for i, records, delta in stream_pool_tasks(p, task, todo, chunksize,
+                max_in_flight):
+            metrics.add_delta(delta)
+            changed = []
+            for pos, (h, masks) in enumerate(records):
+                merged = merge_record(i, pos, h, masks)
+                if merged != "new":
+                    metrics.count("duplicates")
+                if merged != None:
+                    changed.append((pos, h, masks))
+            if checkpoint != None:
+                checkpoint.append_item(stage, i, changed)
+
+            num_done += 1
+            metrics.progress(num_done, len(items))
+            if num_done % batchsize == 0 or num_done == len(items):
+                print("Finished {}/{} {}, {} sol total".format(
+                    num_done, len(items), label, len(known_records)))
+    if own_store:
+        known.close()
+
+    known_records.sort()
+    if with_hashes:
+        return [(h, design_from_masks(n, masks)) 
+            for key, masks, h in known_records]
+    return [design_from_masks(n, masks) for key, masks, h in known_records]
+
+# Find all completions of a list of seeds on a process pool, deduplicated by 
+# certificate. Keyword arguments are passed on to all_full_completions. 
+def find_all_completions_multithreaded(seeds, batchsize=1000, 
+        cover_backend = "algx", minlen = 3, canonical = False, 
+        symmetry_pruning = False, chunksize = 4, max_in_flight = None,
+        with_hashes = False, checkpoint = None, stage = None):
+    if len(seeds) == 0:
+        return []
+    complete = functools.partial(completion_records, minlen = minlen,
+        cover_backend = cover_backend, canonical = canonical, 
+        symmetry_pruning = symmetry_pruning)
+    return merge_records_multithreaded(complete, seeds, seeds[0].num_points,
+        "seeds", batchsize, chunksize, max_in_flight, with_hashes, 
+        checkpoint = checkpoint, stage = stage)
 
+"""
+Checkpointed stages. checkpoint is a checkpoint.Checkpoint, or None to run 
+without checkpoints.
+"""
+# return the designs of a stage from the checkpoint if the stage finished
+# before, otherwise compute them with compute() and save them
+def checkpointed_stage(checkpoint, stage, npoints, compute):
+    if checkpoint != None and checkpoint.has_stage(stage):
+        designs = [PartialDesign(npoints, lines) 
+            for lines in checkpoint.load_stage(stage)]
+        print("Loaded {} designs of stage {} from checkpoint".format(
+            len(designs), stage))
+        return designs
+
+    with metrics.stage(stage):
+        designs = compute()
+    if checkpoint != None:
+        checkpoint.save_stage(stage, [pd.lines for pd in designs])
+    return designs
+
+# Find all completions of the seeds with lines of length at least minlen, 
+# deduplicated by certificate. With a checkpoint, the designs kept are logged
+# as each seed is completed, so that a resumed run skips the seeds already
+# completed.
+def complete_all_seeds(seeds, minlen = 3, multithreaded = False, 
+        cover_backend = "algx", canonical = False, symmetry_pruning = False,
+        checkpoint = None, stage = None):
+    if len(seeds) == 0:
+        return []
+    n = seeds[0].num_points
+
+    with metrics.stage(stage if stage != None else "completions"):
+        if multithreaded:
+            return find_all_completions_multithreaded(seeds, 
+                cover_backend = cover_backend, minlen = minlen, 
+                canonical = canonical, symmetry_pruning = symmetry_pruning,
+                checkpoint = checkpoint, stage = stage)
+
+        # the designs found so far, and their certificates
+        known_completions = []
+        known_full_hashes = new_certificate_store()
+        finished = set()
+        if checkpoint != None:
+            finished, records = checkpoint.load_items(stage)
+            for i, pos, h, masks in records:
+                known_full_hashes.add(h)
+                known_completions.append(design_from_masks(n, masks))
+            if len(finished) > 0:
+                print("Resuming {} after {} completed seeds, {} designs".format(
+                    stage, len(finished), len(known_completions)))
+
+        for i,s in enumerate(seeds):
+            if i in finished:
+                continue
+            print("Completing full design:", i, '/', len(seeds), ':', 
+                len(known_completions))
+            metrics.progress(i, len(seeds))
+            # all_full_completions only returns designs not seen before, and 
+            # adds them to known_full_hashes itself
+            records = all_full_completions(s, known_full_hashes, minlen, 
+                cover_backend, canonical, symmetry_pruning, with_hashes = True)
+            known_completions += [pd for h, pd in records]
+            if checkpoint != None:
+                checkpoint.append_item(stage, i, [(pos, h, 
+                    tuple(line_mask(l) for l in pd.lines)) 
+                    for pos, (h, pd) in enumerate(records)])
+
+        known_full_hashes.close()
+        return known_completions
+
+# Multithreaded version of calling enumerate_saturations on every seed with a 
+# shared set of known hashes.
+def find_all_saturations_multithreaded(seeds, point_saturate, batchsize=1000,
+        cover_backend = "algx", canonical = False, symmetry_pruning = False,
+        chunksize = 4, max_in_flight = None):
+    if len(seeds) == 0:
+        return []
+    saturate = functools.partial(saturation_records, 
+        point_saturate = point_saturate, cover_backend = cover_backend, 
+        canonical = canonical, symmetry_pruning = symmetry_pruning)
+    return merge_records_multithreaded(saturate, seeds, seeds[0].num_points,
+        "seeds", batchsize, chunksize, max_in_flight)
+
+# Multithreaded version of find_all_seeds. The search is run serially up to 
+# frontier_depth lines past the initial line, and the branches left there are 
+# searched on a process pool. Without canonical augmentation the branches do not
+# share their known hashes, so seeds are deduplicated by certificate at the end.
+def find_all_seeds_multithreaded(npoints, initial_len, pt_up_to, 
+        canonical = False, frontier_depth = 2, chunksize = 1):
+    print(("Finding all seeds using multithreading: npoints = {}, " + 
+        "initial_len = {}").format(npoints, initial_len))
+    frontier = find_all_seeds(npoints, initial_len, pt_up_to, verbose = False,
+        canonical = canonical, frontier_depth = frontier_depth)
+    search = functools.partial(seed_records, npoints = npoints, 
+        initial_len = initial_len, pt_up_to = pt_up_to, canonical = canonical)
+    return merge_records_multithreaded(search, frontier, npoints, 
+        "branches", 1000, chunksize, known = KeyIds() if canonical else None)
+
+
+# The seeds completed to designs with minimum line length 3: seeds on 2 
+# vertices, with the 3rd vertex of the initial line on 3 vertices saturated.
+def find_min3_seeds(npoints, multithreaded = False, cover_backend = "algx", 
+        canonical = False, symmetry_pruning = False, checkpoint = None):
     # first find seeds on 2 vertices
-    all_seeds = find_all_seeds(npoints, 3, 2)
+    def seeds():
+        if not multithreaded:
+            return find_all_seeds(npoints, 3, 2, canonical = canonical)
+        return find_all_seeds_multithreaded(npoints, 3, 2, canonical)
+    all_seeds = checkpointed_stage(checkpoint, "min3_seeds", npoints, seeds)
 
     # then add seeds on the 3rd vertex also on the initial line on 3 vertices
-    all_line_completions = []
-    known_hashes_first_line = set([])
-    for i,s in enumerate(all_seeds):
-        print("Completing first line:", i, '/', len(all_seeds), ':',
-            len(known_hashes_first_line))
-        all_line_completions += enumerate_saturations(s, 2, 
-            known_hashes_first_line)
+    def line_completions():
+        if multithreaded:
+            return find_all_saturations_multithreaded(all_seeds, 2, 
+                cover_backend = cover_backend, canonical = canonical, 
+                symmetry_pruning = symmetry_pruning)
+        completions = []
+        known_hashes_first_line = new_certificate_store()
+        for i,s in enumerate(all_seeds):
+            print("Completing first line:", i, '/', len(all_seeds), ':',
+                len(known_hashes_first_line))
+            metrics.progress(i, len(all_seeds))
+            completions += enumerate_saturations(s, 2, 
+                known_hashes_first_line, cover_backend, canonical, 
+                symmetry_pruning)
+        known_hashes_first_line.close()
+        return completions
+    all_line_completions = checkpointed_stage(checkpoint, "min3_first_line", 
+        npoints, line_completions)
 
     print("Found first line completions:", len(all_line_completions))
+    return all_line_completions
+
+# The seeds completed to designs with minimum line length at least 4: an 
+# initial line with minlen points saturated, for each 4 <= minlen < maxlen.
+def find_min4_seeds(npoints, multithreaded = False, canonical = False, 
+        checkpoint = None):
+    maxlen = npoints // 2 + 1
+
+    # first find all seeds, saturating an initial lin with minlen points
+    def seeds():
+        all_seeds = []
+        for minlen in range(4, maxlen):
+            if not multithreaded:
+                all_seeds += find_all_seeds(npoints, minlen, minlen, 
+                    canonical = canonical)
+            else:
+                all_seeds += find_all_seeds_multithreaded(npoints, minlen, 
+                    minlen, canonical)
+        return all_seeds
+    return checkpointed_stage(checkpoint, "min4_seeds", npoints, seeds)
+
+# Enumerate all Sylvester-Gallai designs on npoints points with minimum line 
+# length 3. 
+def enumerate_full_solutions_min3(npoints, multithreaded = False, 
+        cover_backend = "algx", canonical = False, symmetry_pruning = False,
+        checkpoint = None):
+    print(("Finding Sylvester-Gallai designs on {} points " + 
+        "with min length three").format(npoints))
+    all_line_completions = find_min3_seeds(npoints, multithreaded, 
+        cover_backend, canonical, symmetry_pruning, checkpoint)
 
     # finally find all completions our set of seeds
-    all_sg_completions = []
-    if not multithreaded:
-        known_full_hashes = set([])
-        for i,s in enumerate(all_line_completions):
-            print("Completing full design:", i, '/', len(all_line_completions), ':',
-                len(known_full_hashes))
-            all_sg_completions += all_full_completions(s, known_full_hashes)
-    else:
+    if multithreaded:
         print("Finding all completions using multithreading, {} cpus.".format(\
             multiprocessing.cpu_count()))
-        all_sg_completions = find_all_completions_multithreaded(\
-            all_line_completions)
+    all_sg_completions = complete_all_seeds(all_line_completions, 3, 
+        multithreaded, cover_backend, canonical, symmetry_pruning, 
+        checkpoint, "min3_completions")
 
     print("Found full designs:", len(all_sg_completions))
     return all_sg_completions
 
 # Enumerate all Sylvester-Gallai designs on npoints points with minimum line 
 # length greater than or equal to 4. 
-def enumerate_full_solutions_min4(npoints):
+def enumerate_full_solutions_min4(npoints, cover_backend = "algx", 
+        canonical = False, symmetry_pruning = False, multithreaded = False,
+        checkpoint = None):
     print(("Finding Sylvester-Gallai designs on {} points " + 
             "with min length four or more").format(npoints))    
-    maxlen = npoints // 2 + 1
-    all_seeds = []
-
-    # first find all seeds, saturating an initial lin with minlen points
-    for minlen in range(4, maxlen):
-        all_seeds += find_all_seeds(npoints, minlen, minlen)
-
-    all_sg_completions = []
-    known_full_hashes = set([])
+    all_seeds = find_min4_seeds(npoints, multithreaded, canonical, checkpoint)
 
     # then find all completions of the seeds, making sure to use lines 
     # of length at least four
-    for i,s in enumerate(all_seeds):
-        print("Completing full design:", i, '/', len(all_seeds), ':',
-            len(known_full_hashes))
-        all_sg_completions += all_full_completions(s, known_full_hashes, 4)
-        
+    all_sg_completions = complete_all_seeds(all_seeds, 4, multithreaded, 
+        cover_backend, canonical, symmetry_pruning, checkpoint, 
+        "min4_completions")
 
     print("Found full designs with min length at least four:", 
         len(all_sg_completions))
     return all_sg_completions
 
-def enumerate_all_sg_designs(npoints, multithreaded = False):
-    designs_big = enumerate_full_solutions_min4(npoints)
-    designs_three = enumerate_full_solutions_min3(npoints, multithreaded)
+def enumerate_all_sg_designs(npoints, multithreaded = False, 
+        cover_backend = "algx", canonical = False, symmetry_pruning = False,
+        checkpoint = None):
+    designs_big = enumerate_full_solutions_min4(npoints, cover_backend, 
+        canonical, symmetry_pruning, multithreaded, checkpoint)
+    designs_three = enumerate_full_solutions_min3(npoints, multithreaded, 
+        cover_backend, canonical, symmetry_pruning, checkpoint)
     return designs_big + designs_three
 
-def compute_and_save(npoints, multithreaded = False):
-    my_solutions = enumerate_all_sg_designs(npoints, multithreaded)
-
+# Stages finished so far are checkpointed in saved_classification/checkpoint_n,
+# which is marked done once the classification is saved. With resume, a 
+# checkpoint left by an interrupted run is picked up rather than discarded, and
+# npoints is skipped if its checkpoint is done.
+def compute_and_save(npoints, multithreaded = False, cover_backend = "algx",
+        canonical = False, symmetry_pruning = False, resume = False):
+    checkpoint = Checkpoint("saved_classification/checkpoint_{}".format(
+        npoints), resume)
+    if checkpoint.is_done():
+        print("Classification on {} points already saved".format(npoints))
+        return
+    my_solutions = enumerate_all_sg_designs(npoints, multithreaded, 
+        cover_backend, canonical, symmetry_pruning, checkpoint)
+    save_classification(npoints, my_solutions)
+    checkpoint.mark_done()
+
+# write the designs on npoints points to saved_classification, as text and as
+# a design store
+def save_classification(npoints, my_solutions):
     with open("saved_classification/all_unique_sg_{}.txt".format(npoints), "w") as dataf:
         dataf.write("All unique sylvester gallai designs on {} points\n".format(npoints))
         for i, pd in enumerate(my_solutions):
@@ -526,9 +1308,8 @@ def compute_and_save(npoints, multithreaded = False):
                 dataf.write("\n")
             dataf.write("\n")
 
-    all_trips = [pd.lines for pd in my_solutions]
-    with open("saved_classification/all_unique_sg_{}.dill".format(npoints), "wb") as dillf:
-        dill.dump(all_trips, dillf)
+    write_designs(store_path(npoints), npoints, 
+        [pd.lines for pd in my_solutions])
 
 
 help_message = "Use this program to classify combinatorial " + \
@@ -537,6 +1318,18 @@ help_message = "Use this program to classify combinatorial " + \
                " -M maximum number of points to solve\n" + \
                " -multi (y/n) choose to enable or disable multithreading. " +\
                     "Defaults to yes.\n" +  \
+               " -cover (algx/bitset) exact cover solver used to complete " +\
+                    "designs. Defaults to algx.\n" + \
+               " -canon (y/n) reject isomorphs by canonical augmentation " +\
+                    "instead of sets of known hashes. Defaults to no.\n" + \
+               " -sym (y/n) skip exact cover branches equivalent under the " +\
+                    "automorphisms of the seed. Defaults to no.\n" + \
+               " -resume continue an interrupted run from its checkpoint, " +\
+                    "skipping the numbers of points it saved\n" + \
+               " -certmem (bytes) memory for the certificates of a stage, " +\
+                    "spilling them to disk past it. Defaults to no limit.\n" +\
+               " -metrics (path) append metrics snapshots to path, see " +\
+                    "metrics.py\n" + \
                " -h print this message"
 
 
@@ -546,7 +1339,12 @@ if __name__ == '__main__':
     minc = None
     maxc = None
     multithreaded = True
+    cover_backend = "algx"
+    canonical = False
+    symmetry_pruning = False
     print_help = False
+    metrics_path = None
+    resume = '-resume' in sys.argv
     for a, b in zip(sys.argv, sys.argv[1:]):
         if a == "-m":
             minc = int(b)
@@ -557,6 +1355,16 @@ if __name__ == '__main__':
                 multithreaded = True
             if b == 'f':
                 multithreaded = False
+        if a == '-cover':
+            cover_backend = b
+        if a == '-canon':
+            canonical = (b == 'y')
+        if a == '-sym':
+            symmetry_pruning = (b == 'y')
+        if a == '-metrics':
+            metrics_path = b
+        if a == '-certmem':
+            CERTIFICATE_MEMORY = int(b)
         if a == '-h' or b == '-h':
             print_help = True
 
@@ -569,10 +1377,15 @@ if __name__ == '__main__':
         exit()
 
     print("Creating and saving solutions for {} <= n <= {}".format(minc, maxc))
+    if metrics_path != None:
+        metrics.enable(metrics_path)
 
     for npoints in range(minc, maxc+1):
         print("------------------\nFINDING ALL DESIGNS: {}\n------------".format(npoints))
-        compute_and_save(npoints, multithreaded)
+        with metrics.stage("n{}".format(npoints)):
+            compute_and_save(npoints, multithreaded, cover_backend, canonical,
+                symmetry_pruning, resume)
+    metrics.disable()
 
     #     all_trips = [pd.lines for pd in my_solutions]
     #     with open("saved_classification/all_unique_sg_{}.dill".format(npoints), "wb") as dillf:
@@ -1,43 +1,91 @@
 import sys
+import os
+import io
+import json
+import time
+import signal
+import select
+import pickle
+import resource
+import contextlib
+import collections
+import functools
 # from sage.all import *
-import dill
 import numpy as np
-import random
 import itertools
 from sympy import *
-from sg_design_finder import PartialDesign
-
+from sympy.polys.rings import ring
+from sympy.matrices import MatrixBase
+import pynauty
+from sg_design_finder import make_bipartite_for_design_linelist
+from solve_exact_cover import popcount
+from design_store import load_designs
+import metrics
+from multiprocessing import Pool
+
+# designs are built lazily from the binary store as they are accessed
 def load_configs(n):
-    fn = "saved_classification/all_unique_sg_" + str(n) + ".dill"
-    with open(fn, "rb") as dillf:
-        all_solutions_lines = dill.load(dillf)
-        all_designs = [PartialDesign(n, lines) for lines in all_solutions_lines]
-
-    return all_designs
-
-# load all configs
-all_configs = {}
-for n in range(7, 17):
-    all_configs[n] = load_configs(n)
+    return load_designs(n)
+
+# configs loaded so far, by number of points
+_configs = {}
+
+# the configs on n points, loaded on first use
+def get_configs(n):
+    if n not in _configs:
+        _configs[n] = load_configs(n)
+    return _configs[n]
+
+# point-line incidence of a design, computed once and shared by all calls of 
+# forced_set on that design. Returns lists of
+# - lines_through[p]: indices of the lines through point p
+# - points_on[l]: the points on line l
+# - point_masks[l]: bitmask of the points on line l
+# - line_masks[p]: bitmask of the lines through point p
+def design_incidence(pd):
+    lines_through = [[] for p in range(pd.num_points)]
+    line_masks = [0] * pd.num_points
+    points_on = []
+    point_masks = []
+    for line_num, l in enumerate(pd.lines):
+        mask = 0
+        for pt_num in l:
+            lines_through[pt_num].append(line_num)
+            line_masks[pt_num] |= 1 << line_num
+            mask |= 1 << pt_num
+        points_on.append(list(l))
+        point_masks.append(mask)
+    return lines_through, points_on, point_masks, line_masks
+
+# indices of the two lowest set bits of mask
+def two_lowest_bits(mask):
+    low = mask & -mask
+    mask ^= low
+    return [low.bit_length() - 1, (mask & -mask).bit_length() - 1]
 
 # compute the set of points determined by the position of "choices"
 # think of it as a game on a graph: we color some points red, then at each step, 
 # color a white vertex red if its adjacent to two red vertices 
 # eg point on two lines or line on two points
-def forced_set(pd, initials):
-
-    # adjacency matrix for bipartite graph
-    # the i, j column is 1 if that point & line are connected, 0 otherwise
-    adj_mat = np.zeros((pd.num_points, len(pd.lines)), dtype=np.int) 
-    for line_num,l in enumerate(pd.lines):
-        for pt_num in l:
-            adj_mat[pt_num, line_num] = 1
-
-    # 0-1 vector recording which vertices & lines are hit
-    hit_points = np.zeros(pd.num_points, dtype=np.int)
-    hit_lines = np.zeros(len(pd.lines), dtype=np.int)
-    for pt_num in initials:
-        hit_points[pt_num] = 1
+# The game is played in rounds: a round first colors the lines on two points 
+# red at the start of the round, then the points on two lines red at the start 
+# of the round. Each point and line keeps a count of its red neighbours, 
+# updated once per incidence, so the whole game takes time linear in the number
+# of incidences. incidence is the result of design_incidence(pd), if known.
+def forced_set(pd, initials, incidence = None):
+    if incidence == None:
+        incidence = design_incidence(pd)
+    lines_through, points_on, point_masks, line_masks = incidence
+
+    # bitmasks of the hit points and lines, and the number of hit neighbours
+    hit_points = 0
+    hit_lines = 0
+    num_hit_adj_pts = [0] * pd.num_points
+    num_hit_adj_lines = [0] * len(pd.lines)
+
+    # lines and points with two hit neighbours which are not hit yet
+    next_lines = set()
+    next_pts = set()
 
     pt_order = []
     lines_defining_pt = {}
@@ -46,38 +94,40 @@ def forced_set(pd, initials):
     for i in initials:
         pt_order.append(i)
         lines_defining_pt[i] = []
-
-    
-
-    # we compute how many hit lines are adjacent by adj_mat * hit_lines
-    # we compute how many hit vertices are adjacent by hit_lines * adj_mat
-    # we set those with > 1 hit to true
-
-    did_add = True
-    while did_add:
-        did_add = False
-        num_hit_adj_pts = np.matmul(adj_mat, hit_lines)
-        num_hit_adj_lines = np.matmul(np.transpose(adj_mat), hit_points)
-
-        for i in range(len(pd.lines)):
-            if num_hit_adj_lines[i] > 1 and hit_lines[i] == 0:
-                did_add = True
-                hit_lines[i] = 1
-
-                dotted = np.transpose(adj_mat)[i,:] * hit_points
-                nz = np.nonzero(dotted)[0]
-                pts_defining_line[i] = [nz[0], nz[1]]
-
-        for i in range(pd.num_points):
-            if num_hit_adj_pts[i] > 1 and hit_points[i] == 0:
-                did_add = True
-                hit_points[i] = 1
-                pt_order.append(i)
-
-                dotted = adj_mat[i,:] * hit_lines
-                nz = np.nonzero(dotted)[0]
-                lines_defining_pt[i] = [nz[0], nz[1]]
-
+        hit_points |= 1 << i
+    for i in initials:
+        for l in lines_through[i]:
+            num_hit_adj_lines[l] += 1
+            if num_hit_adj_lines[l] == 2:
+                next_lines.add(l)
+
+    while next_lines or next_pts:
+        round_lines = sorted(next_lines)
+        round_pts = sorted(next_pts)
+        next_lines = set()
+        next_pts = set()
+
+        # a line is defined by its two lowest points hit before this round
+        for l in round_lines:
+            pts_defining_line[l] = two_lowest_bits(point_masks[l] & hit_points)
+        for l in round_lines:
+            hit_lines |= 1 << l
+            for p in points_on[l]:
+                num_hit_adj_pts[p] += 1
+                if num_hit_adj_pts[p] == 2 and not (hit_points >> p) & 1:
+                    next_pts.add(p)
+
+        # a point is defined by its two lowest lines hit so far
+        for p in round_pts:
+            hit_points |= 1 << p
+            pt_order.append(p)
+            lines_defining_pt[p] = two_lowest_bits(line_masks[p] & hit_lines)
+        for p in round_pts:
+            next_pts.discard(p)
+            for l in lines_through[p]:
+                num_hit_adj_lines[l] += 1
+                if num_hit_adj_lines[l] == 2 and not (hit_lines >> l) & 1:
+                    next_lines.add(l)
 
     # each entry has 5 points: a point to add, 
     # and two tuples of points defining lines the first point lies on
@@ -87,14 +137,15 @@ def forced_set(pd, initials):
         pts_defining_lines = [pts_defining_line[l] for l in lines_def]
         force_order.append((p, pts_defining_lines))
 
-    return [i for i in range(pd.num_points) if hit_points[i]], force_order
+    return [i for i in range(pd.num_points) if (hit_points >> i) & 1], \
+        force_order
 
 
 
 # test if a subset of points is a forcing fixture
 # choices are point indices
-def is_forcing_fixture(pd, initials):
-    fs, force_order = forced_set(pd, initials)
+def is_forcing_fixture(pd, initials, incidence = None):
+    fs, force_order = forced_set(pd, initials, incidence)
     return len(fs) == pd.num_points, force_order
 
 def has_three_collinear(pd, initial):
@@ -104,27 +155,217 @@ def has_three_collinear(pd, initial):
     else:
         return False
 
+# coll[a][b] is the bitmask of the points other than a, b on the line through
+# a and b, if there is one
+def collinear_masks(pd):
+    coll = [[0] * pd.num_points for p in range(pd.num_points)]
+    for l in pd.lines:
+        mask = 0
+        for p in l:
+            mask |= 1 << p
+        for a, b in itertools.combinations(l, 2):
+            coll[a][b] = coll[b][a] = mask & ~(1 << a) & ~(1 << b)
+    return coll
+
+# orbits of the points under the automorphisms of the design with bipartite 
+# graph g fixing each point of prefix. orbits[p] is the smallest point in the 
+# orbit of p. Also returns the order of that group.
+def stabilizer_orbits(g, num_points, num_lines, prefix):
+    rest = set(range(num_points)).difference(prefix)
+    lineset = set(range(num_points, num_points + num_lines))
+    g.set_vertex_coloring([set([p]) for p in prefix] + [rest, lineset])
+    metrics.count("automorphism_groups")
+    generators, grpsize1, grpsize2, orbits, numorbits = pynauty.autgrp(g)
+    return orbits, grpsize1 * 10**grpsize2
+
+# the forced points and lines, as bitmasks, after adding point x to the forced
+# points hit_points and lines hit_lines
+def extend_closure(incidence, hit_points, hit_lines, x):
+    lines_through, points_on, point_masks, line_masks = incidence
+    hit_points |= 1 << x
+    new_points = [x]
+    while new_points:
+        new_lines = []
+        for p in new_points:
+            for l in lines_through[p]:
+                if not (hit_lines >> l) & 1 and \
+                        popcount(point_masks[l] & hit_points) > 1:
+                    hit_lines |= 1 << l
+                    new_lines.append(l)
+        new_points = []
+        for l in new_lines:
+            for p in points_on[l]:
+                if not (hit_points >> p) & 1 and \
+                        popcount(line_masks[p] & hit_lines) > 1:
+                    hit_points |= 1 << p
+                    new_points.append(p)
+    return hit_points, hit_lines
+
 # try to find a set of points which determine the position of the other points
+# Initial sets are tried in the same order as itertools.combinations, smallest
+# size first, but a set is skipped when
+# - it has three collinear points, 
+# - one of its points is forced by the points before it, as then a smaller set
+#   is forcing, or
+# - one of its points is not the smallest in its orbit under the automorphisms
+#   fixing the points before it, as then the set is not the smallest in its 
+#   orbit, and the smallest set would be forcing as well.
+# None of the skipped sets can be the first forcing set, so the fixture found 
+# is the same as trying every combination. The forced set of a prefix is 
+# extended one point at a time.
 def find_forcing_fixture(pd):
-    for fs_size in range(3, pd.num_points):
-        # print("Trying to find fixture of size:", fs_size)
-        for initial in itertools.combinations(range(pd.num_points), fs_size):
-            if has_three_collinear(pd, initial): # fixture set must have no three collinear
+    n = pd.num_points
+    incidence = design_incidence(pd)
+    coll = collinear_masks(pd)
+    all_points = (1 << n) - 1
+    g = make_bipartite_for_design_linelist(n, pd.lines)
+    orbits = {}
+
+    # extend prefix to fs_size points. blocked is the mask of points collinear
+    # with two points of prefix, and hit_points, hit_lines are forced by prefix.
+    # symmetric is False once the automorphisms fixing prefix are trivial.
+    def search(prefix, fs_size, blocked, hit_points, hit_lines, symmetric):
+        if len(prefix) == fs_size:
+            return prefix if hit_points == all_points else None
+
+        pt_orbits = range(n)
+        if symmetric:
+            if prefix not in orbits:
+                orbits[prefix] = stabilizer_orbits(g, n, len(pd.lines), prefix)
+            pt_orbits, grpsize = orbits[prefix]
+            symmetric = grpsize > 1
+
+        start = prefix[-1] + 1 if prefix else 0
+        for x in range(start, n - (fs_size - len(prefix)) + 1):
+            if ((blocked | hit_points) >> x) & 1 or pt_orbits[x] != x:
                 continue
-            is_forcing, force_order = is_forcing_fixture(pd, initial)
-            if is_forcing:
-                print("Found fixture of size:", fs_size)
-                # print("Force order:")
-                # for dat in force_order:
-                #     print(dat)
-                return initial, force_order
+            x_blocked = blocked
+            for p in prefix:
+                x_blocked |= coll[p][x]
+            x_points, x_lines = extend_closure(incidence, hit_points, 
+                hit_lines, x)
+            initial = search(prefix + (x,), fs_size, x_blocked, x_points, 
+                x_lines, symmetric)
+            if initial != None:
+                return initial
+        return None
+
+    for fs_size in range(3, n):
+        # print("Trying to find fixture of size:", fs_size)
+        initial = search((), fs_size, 0, 0, 0, True)
+        if initial != None:
+            print("Found fixture of size:", fs_size)
+            is_forcing, force_order = is_forcing_fixture(pd, initial, 
+                incidence)
+            # print("Force order:")
+            # for dat in force_order:
+            #     print(dat)
+            return initial, force_order
 
     return False, False
 
 def is_constant(expr):
     return len(expr.free_symbols) == 0
 
-def make_pt_coords(pd, force_order):
+"""
+Polynomial backends for the point coordinates and the equations. "expr" builds
+sympy Matrix objects of expressions, expanding every product, and "ring" works 
+with the sparse polynomials of sympy's ring ZZ[x0, y0], which multiply much 
+faster. Both give the same equations, as expressions.
+"""
+POLY_BACKEND = "ring"
+
+_poly_ring = ring("x0,y0", ZZ)
+
+def cross(u, v):
+    return [u[1]*v[2] - u[2]*v[1], 
+            u[2]*v[0] - u[0]*v[2], 
+            u[0]*v[1] - u[1]*v[0]]
+
+def dot(u, v):
+    return u[0]*v[0] + u[1]*v[1] + u[2]*v[2]
+
+# the line through points a < b, as the cross product of their coordinates,
+# memoized in lines. make_pt_coords and make_eqs share the lines they compute
+# when given the same dict.
+def line_through(pt_coords, lines, a, b):
+    if (a, b) not in lines:
+        lines[(a, b)] = cross(pt_coords[a], pt_coords[b])
+    return lines[(a, b)]
+
+# determinant of the coordinates of points a < b < c, as the product of one of
+# them with the line through the other two, using a memoized line if any
+def triple_det(pt_coords, lines, a, b, c):
+    if (a, b) in lines:
+        return dot(pt_coords[c], lines[(a, b)])
+    if (a, c) in lines:
+        return -dot(pt_coords[b], lines[(a, c)])
+    return dot(pt_coords[a], line_through(pt_coords, lines, b, c))
+
+# backend: "ring" or "expr", defaulting to POLY_BACKEND at call time
+# lines: optional dict in which to memoize the lines through two points
+def make_pt_coords(pd, force_order, backend = None, lines = None):
+    if backend == None:
+        backend = POLY_BACKEND
+    if backend == "expr":
+        return make_pt_coords_expr(pd, force_order)
+    if lines == None:
+        lines = {}
+
+    R, x0, y0 = _poly_ring
+    first_four_vecs = [[R(0), R(0), R(1)],
+            [R(0), R(1), R(0)],
+            [R(1), R(0), R(0)],
+            [R(1), R(1), R(1)],
+            [x0, y0, R(1)]]
+
+    pt_coords = [None for i in range(pd.num_points)]
+    initial_on = 0
+    for pt, fixt in force_order:
+        if fixt == []:
+            pt_coords[pt] = first_four_vecs[initial_on]
+            initial_on += 1
+        else:
+            (p1, p2), (q1, q2) = fixt
+            # point lies on intersection of line through (p1, p2) and (q1, q2)
+            l1 = line_through(pt_coords, lines, p1, p2)
+            l2 = line_through(pt_coords, lines, q1, q2)
+            pt_coords[pt] = cross(l1, l2)
+
+    return pt_coords
+
+# lines: optional dict of memoized lines through two points, as filled in by
+# make_pt_coords
+def make_eqs(pd, pt_coords, lines = None):
+    if isinstance(pt_coords[0], MatrixBase):
+        return make_eqs_expr(pd, pt_coords)
+    if lines == None:
+        lines = {}
+
+    # comes from colinear triples, taken line by line, so that a constant 
+    # polynomial is found before any of the other triples are computed
+    zero_polys = {}
+    for line in pd.lines:
+        for trip in itertools.combinations(line, 3):
+            eq = triple_det(pt_coords, lines, *trip)
+            if eq != 0 and eq.is_ground:
+                print("Found constant polynomial:", eq.as_expr())
+                return False 
+            elif eq != 0:
+                zero_polys[trip] = eq
+
+    # the rest should not be collinear
+    collinear = set()
+    for line in pd.lines:
+        collinear.update(itertools.combinations(line, 3))
+    for trip in itertools.combinations(range(pd.num_points), 3):
+        if trip not in collinear and triple_det(pt_coords, lines, *trip) == 0:
+            print("Found zero poly that should have been nonzero: 0")
+            return False
+
+    return [zero_polys[trip].as_expr() for trip in sorted(zero_polys)]
+
+def make_pt_coords_expr(pd, force_order):
     x0, y0 = symbols('x0 y0')
     first_four_vecs = [Matrix([0,0,1]),
             Matrix([0,1,0]),
@@ -155,7 +396,7 @@ def make_pt_coords(pd, force_order):
 
     return pt_coords
 
-def make_eqs(pd, pt_coords):
+def make_eqs_expr(pd, pt_coords):
     # comes from colinear triples
     zero_polys = []
 
@@ -188,6 +429,105 @@ def make_eqs(pd, pt_coords):
 
     return zero_polys
 
+"""
+Numeric sieve. Rather than solving the collinearity equations symbolically, 
+look for a solution numerically: starting from random complex x0, y0, points 
+are placed as in make_pt_coords, and x0, y0 are moved by damped Gauss-Newton 
+steps to make the determinants of the collinear triples vanish. A solution 
+with x0, y0 away from the degenerate positions, and no other triple collinear,
+is an embedding over the complex numbers, so 1 is not in the ideal and the 
+design is possibly embeddable. When no start converges nothing is concluded.
+"""
+NUMERIC_STARTS = 32
+NUMERIC_ITERATIONS = 30
+NUMERIC_TOLERANCE = 1e-9
+NUMERIC_SEPARATION = 1e-6
+
+# coordinates of the points for each of S pairs (x0, y0), following 
+# force_order as make_pt_coords does. params is an (S, 4) array of the real 
+# and imaginary parts of x0 and y0. Returns an (S, n, 3) complex array, each 
+# point scaled to unit length.
+def numeric_pt_coords(pd, force_order, params):
+    x0 = params[:,0] + 1j * params[:,1]
+    y0 = params[:,2] + 1j * params[:,3]
+    ones = np.ones(len(params))
+    first_four_vecs = [[0,0,1], [0,1,0], [1,0,0], [1,1,1]]
+    first_four_vecs = [np.outer(ones, v) for v in first_four_vecs] + \
+        [np.stack([x0, y0, ones], axis = 1)]
+
+    pt_coords = np.zeros((len(params), pd.num_points, 3), dtype = complex)
+    initial_on = 0
+    for pt, fixt in force_order:
+        if fixt == []:
+            pc = first_four_vecs[initial_on]
+            initial_on += 1
+        else:
+            (p1, p2), (q1, q2) = fixt
+            l1 = np.cross(pt_coords[:,p1], pt_coords[:,p2])
+            l2 = np.cross(pt_coords[:,q1], pt_coords[:,q2])
+            pc = np.cross(l1, l2)
+        pt_coords[:,pt] = pc / np.linalg.norm(pc, axis = 1)[:,None]
+    return pt_coords
+
+# triples of points on a common line, and the other triples, as index arrays
+def split_triples(pd):
+    collinear = set()
+    for line in pd.lines:
+        collinear.update(itertools.combinations(line, 3))
+    others = [trip for trip in itertools.combinations(range(pd.num_points), 3)
+        if trip not in collinear]
+    return np.array(sorted(collinear)), np.array(others).reshape(-1, 3)
+
+# look for a complex embedding of pd with the points placed by force_order.
+# Returns (x0, y0) of an embedding found, or None.
+def numeric_embedding(pd, force_order, num_starts = NUMERIC_STARTS, 
+        iterations = NUMERIC_ITERATIONS, seed = None):
+    collinear, others = split_triples(pd)
+    def residuals(params):
+        pts = numeric_pt_coords(pd, force_order, params)
+        dets = np.linalg.det(pts[:, collinear])
+        return np.concatenate([dets.real, dets.imag], axis = 1), pts
+
+    rng = np.random.default_rng(seed)
+    params = rng.normal(size = (num_starts, 4))
+    with np.errstate(all = "ignore"):
+        for it in range(iterations):
+            # residuals at params and at params moved along each coordinate, 
+            # evaluated together, for a finite difference jacobian of shape 
+            # (S, residuals, 4)
+            h = 1e-7
+            moved = params[None] + h * np.eye(4)[:,None,:]
+            all_r = residuals(np.concatenate([params[None], moved]).reshape(
+                -1, 4))[0].reshape(5, num_starts, -1)
+            r = all_r[0]
+            jac = np.transpose((all_r[1:] - r) / h, (1, 2, 0))
+            # starts which hit a degenerate placement are dropped
+            alive = np.all(np.isfinite(r), axis = 1) & \
+                np.all(np.isfinite(jac), axis = (1, 2))
+            if not np.any(alive) or \
+                    np.any(np.all(np.abs(r[alive]) < NUMERIC_TOLERANCE, axis=1)):
+                break
+            r[~alive] = 0
+            jac[~alive] = 0
+            jt = np.transpose(jac, (0, 2, 1))
+            step = np.linalg.solve(jt @ jac + 1e-12 * np.eye(4), 
+                -(jt @ r[:,:,None]))[:,:,0]
+            params = np.where(alive[:,None], params + step, np.nan)
+
+        r, pts = residuals(params)
+        x0 = params[:,0] + 1j * params[:,1]
+        y0 = params[:,2] + 1j * params[:,3]
+        degenerate = np.stack([x0, y0, 1-x0, 1-y0, x0-y0], axis = 1)
+        other_dets = np.linalg.det(pts[:, others]) if len(others) else \
+            np.ones((num_starts, 1))
+        good = np.all(np.abs(r) < NUMERIC_TOLERANCE, axis = 1) & \
+            np.all(np.abs(degenerate) > NUMERIC_SEPARATION, axis = 1) & \
+            np.all(np.abs(other_dets) > NUMERIC_SEPARATION, axis = 1)
+
+    for s in np.nonzero(good)[0]:
+        return complex(x0[s]), complex(y0[s])
+    return None
+
 def resolve_eqs(eqs, method = "grlex"):
     x0, y0 = symbols('x0 y0')
     z = symbols('z')
@@ -197,29 +537,247 @@ def resolve_eqs(eqs, method = "grlex"):
 
     return G
 
-def possibly_embeddable(pd):
-    init, fo = find_forcing_fixture(pd)
+"""
+Groebner strategies. Whether 1 is in the ideal does not depend on the monomial
+order, the order of the variables, or how x0, y0 are kept away from the 
+degenerate positions x0*y0*(1-x0)*(1-y0)*(x0-y0) = 0, but the time taken can
+differ enormously. A strategy is
+- name: recorded with the verdict
+- order: monomial order passed to groebner
+- gens: order of the variables x0, y0
+- saturation: "product" adds 1 - z*x0*y0*(1-x0)*(1-y0)*(x0-y0), as resolve_eqs 
+  does, and "split" adds 1 - z_i*f_i for each factor f_i separately
+"""
+GroebnerStrategy = collections.namedtuple("GroebnerStrategy", 
+    ["name", "order", "gens", "saturation"])
+
+GROEBNER_STRATEGIES = [
+    GroebnerStrategy("grlex", "grlex", ("x0", "y0"), "product"),
+    GroebnerStrategy("grevlex", "grevlex", ("x0", "y0"), "product"),
+    GroebnerStrategy("grevlex-yx", "grevlex", ("y0", "x0"), "product"),
+    GroebnerStrategy("grevlex-split", "grevlex", ("x0", "y0"), "split"),
+    GroebnerStrategy("lex", "lex", ("x0", "y0"), "product"),
+    GroebnerStrategy("lex-yx-split", "lex", ("y0", "x0"), "split"),
+]
+
+# seconds and bytes of memory allowed for each strategy
+GROEBNER_TIMEOUT = 60
+GROEBNER_MEMORY = 4 * 2**30
+
+# primes for the modular check. On the 353 designs on 15 and 16 points decided
+# by a groebner basis, it took 22.6s against 16.8s for the exact grlex strategy
+# (41.4s with grevlex), agreeing on all of them. It is not a proof and not 
+# faster on such designs, so it is only a fallback for equations on which the
+# first exact strategy does not finish, eg. from the growth of its coefficients.
+MODULAR_PRIMES = [2147483647, 2147483629]
+
+def resolve_eqs_strategy(eqs, strategy):
+    x0, y0 = symbols('x0 y0')
+    factors = [x0, y0, 1-x0, 1-y0, x0-y0]
+    gens = list(symbols(strategy.gens))
+    if strategy.saturation == "product":
+        z = symbols('z')
+        extra_eqs = [1 - z * x0*y0*(1-x0)*(1-y0)*(x0-y0)]
+        gens.append(z)
+    else:
+        zs = symbols('z0:{}'.format(len(factors)))
+        extra_eqs = [1 - zi * f for zi, f in zip(zs, factors)]
+        gens += list(zs)
+    return groebner(eqs + extra_eqs, *gens, order=strategy.order)
+
+# True if 1 is in the ideal of the equations with strategy
+def has_one_in_ideal(eqs, strategy):
+    return resolve_eqs_strategy(eqs, strategy) == [1]
+
+# Whether 1 is in the ideal of the equations, computed modulo each of primes
+# rather than over the rationals, which avoids the growth of the coefficients.
+# For all but finitely many primes the answer is the same as over the 
+# rationals, so the answers for all primes agreeing is taken as the answer, 
+# but it is not a proof. Returns True or False, or None if the primes disagree.
+def modular_one_in_ideal(eqs, primes = MODULAR_PRIMES):
+    x0, y0, z = symbols('x0 y0 z')
+    extra_eq = 1 - z * x0*y0*(1-x0)*(1-y0)*(x0-y0)
+    answers = set(groebner(eqs + [extra_eq], x0, y0, z, order="grlex", 
+        modulus=p) == [1] for p in primes)
+    if len(answers) > 1:
+        return None
+    return answers.pop()
+
+class GroebnerSetupError(Exception):
+    pass
+
+# limit the address space of this process to memory bytes, or to the hard 
+# limit if that is lower. Only the soft limit is set, as raising the hard limit
+# is not allowed.
+def limit_memory(memory):
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory = min(memory, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory, hard))
+
+# Run f(*args) in a forked child process, killed after timeout seconds and 
+# limited to memory bytes of address space. Returns ("ok", result), 
+# ("timeout", None), ("memory", None), ("error", description), or 
+# ("setup", description) if the memory limit could not be set. Forking 
+# directly rather than through multiprocessing also works in the daemonic 
+# workers of the sweep's process pool.
+def run_in_subprocess(f, args, timeout = None, memory = None):
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            if memory != None:
+                limit_memory(memory)
+        except (ValueError, OSError) as e:
+            result = ("setup", repr(e))
+        else:
+            try:
+                result = ("ok", f(*args))
+            except MemoryError:
+                result = ("memory", None)
+            except BaseException as e:
+                result = ("error", repr(e))
+        with os.fdopen(w, "wb") as resultf:
+            resultf.write(pickle.dumps(result))
+        os._exit(0)
+
+    os.close(w)
+    data = b""
+    deadline = None if timeout == None else time.time() + timeout
+    try:
+        with os.fdopen(r, "rb") as resultf:
+            while True:
+                wait = None if deadline == None else deadline - time.time()
+                if wait != None and wait <= 0:
+                    return ("timeout", None)
+                ready, _, _ = select.select([resultf], [], [], wait)
+                if not ready:
+                    return ("timeout", None)
+                chunk = os.read(resultf.fileno(), 1 << 16)
+                if not chunk:
+                    break
+                data += chunk
+    finally:
+        # kill the child if it is still running, eg. on timeout or if the 
+        # caller was interrupted
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+
+    if not data:
+        # the child died without reporting, usually from running out of memory
+        return ("memory", None)
+    return pickle.loads(data)
+
+# decide whether 1 is in the ideal of the equations, trying each strategy in
+# turn in a subprocess with a time and memory budget. Returns True or False,
+# or None if no strategy finished, and a list of the attempts made, each 
+# (strategy name, outcome, seconds). Unless certify is True, the modular check
+# (strategy "modular") is tried when the first strategy does not finish, and 
+# its answer is used when the primes agree. Raises GroebnerSetupError if the
+# subprocess could not be set up, as every strategy would then fail.
+def resolve_eqs_adaptive(eqs, strategies = GROEBNER_STRATEGIES, 
+        timeout = GROEBNER_TIMEOUT, memory = GROEBNER_MEMORY, certify = False):
+    plan = [(strategy.name, has_one_in_ideal, (eqs, strategy)) 
+        for strategy in strategies]
+    if not certify:
+        plan.insert(1, ("modular", modular_one_in_ideal, (eqs,)))
+
+    attempts = []
+    for name, f, args in plan:
+        start = time.time()
+        outcome, result = run_in_subprocess(f, args, timeout, memory)
+        if outcome == "setup":
+            raise GroebnerSetupError("could not run strategy {}: {}".format(
+                name, result))
+        if outcome == "ok" and result == None:
+            outcome = "inconclusive"
+        attempts.append((name, outcome, time.time() - start))
+        if outcome == "ok":
+            return result, attempts
+    return None, attempts
+
+# decide whether pd could be embeddable. Returns a record with
+# - fixture: the forcing fixture used, or None if there is none of size <= 5
+# - verdict: "not embeddable" or "possibly embeddable", or "undecided" if no
+#   groebner strategy finished within its budget
+# - reason: the step which decided the verdict
+# - timings: seconds spent finding the fixture, in the numeric sieve, making 
+#   the equations and computing the groebner basis
+# - numeric_solution: x0, y0 of the embedding found by the numeric sieve, as
+#   [real, imaginary] pairs
+# - groebner_attempts: (strategy, outcome, seconds) of each groebner strategy
+#   tried, and strategy: the one which decided the verdict
+# With certify, the verdict is never taken from the numeric sieve or the 
+# modular check.
+def classify_embedding(pd, groebner_timeout = GROEBNER_TIMEOUT,
+        groebner_memory = GROEBNER_MEMORY, certify = False):
+    record = {"fixture": None, "verdict": None, "reason": None, 
+        "timings": {}}
+    def decide(verdict, reason, message):
+        print(message)
+        record["verdict"] = verdict
+        record["reason"] = reason
+        return record
+
+    start = time.time()
+    with metrics.stage("fixture"):
+        init, fo = find_forcing_fixture(pd)
+    record["timings"]["fixture"] = time.time() - start
     if init == False:
-        print("Could not find fixture of size <= 5 with no three collinear, could be embeddable")
-        return True
+        return decide("possibly embeddable", "no fixture", "Could not find " +
+            "fixture of size <= 5 with no three collinear, could be embeddable")
     if len(init) > 5:
-        print("Could not find fixture of size 5, could be embeddable")
-        return True
-
-    pt_coords = make_pt_coords(pd, fo)
-    zero_eqs = make_eqs(pd, pt_coords)
+        return decide("possibly embeddable", "no fixture", 
+            "Could not find fixture of size 5, could be embeddable")
+    record["fixture"] = list(init)
+
+    if not certify:
+        start = time.time()
+        with metrics.stage("numeric"):
+            solution = numeric_embedding(pd, fo, seed = 0)
+        record["timings"]["numeric"] = time.time() - start
+        if solution != None:
+            record["numeric_solution"] = [[v.real, v.imag] for v in solution]
+            return decide("possibly embeddable", "numeric", 
+                "Found numeric embedding, could be embeddable")
+
+    start = time.time()
+    lines = {}
+    with metrics.stage("equations"):
+        pt_coords = make_pt_coords(pd, fo, lines = lines)
+        zero_eqs = make_eqs(pd, pt_coords, lines)
+    record["timings"]["equations"] = time.time() - start
     if zero_eqs == False:
-        print("Became clear making equations that design is not embeddable")
-        return False
-
-    G = resolve_eqs(zero_eqs)
-    if G == [1]:
-        print("Found 1 in ideal, not embeddable")
-        return False
+        return decide("not embeddable", "equations", "Became clear making " +
+            "equations that design is not embeddable")
+
+    start = time.time()
+    with metrics.stage("groebner"):
+        one_in_ideal, attempts = resolve_eqs_adaptive(zero_eqs, 
+            timeout = groebner_timeout, memory = groebner_memory, 
+            certify = certify)
+    for name, outcome, seconds in attempts:
+        metrics.count("groebner_" + outcome)
+    record["timings"]["groebner"] = time.time() - start
+    record["groebner_attempts"] = attempts
+    if one_in_ideal == None:
+        return decide("undecided", "groebner", 
+            "No groebner strategy finished, undecided")
+    record["strategy"] = attempts[-1][0]
+    reason = "modular" if record["strategy"] == "modular" else "groebner"
+    if one_in_ideal:
+        return decide("not embeddable", reason, 
+            "Found 1 in ideal, not embeddable")
     else:
-        print("Did not find 1 in ideal, could be embeddable")
-        return True
+        return decide("possibly embeddable", reason,
+            "Did not find 1 in ideal, could be embeddable")
 
+def possibly_embeddable(pd):
+    return classify_embedding(pd)["verdict"] == "possibly embeddable"
 
 # all but one of the configurations have a fixture of size <= 5
 # this is 67/119 for 15 pts
@@ -227,22 +785,131 @@ def possibly_embeddable(pd):
 # have 3 pairs of two lines passing through them
 # this is impossible
 
-possibly_embeddable_pds = []
-for num_pts in range(7, 17):
-    print("\n\nOn designs with ", str(num_pts), " points.")
-    for i, pd in enumerate(all_configs[num_pts]):
-        print("\nOn {}/{}".format(i+1, len(all_configs[num_pts])))
-        # for l in pd.lines:
-        #     print(l)
-        is_possible = possibly_embeddable(pd)
-        if is_possible:
-            print("ADDED POSSIBLY EMBEDDABLE")
-            possibly_embeddable_pds.append(pd)
+"""
+Embedding sweep. Every design is classified by a worker of a process pool, and
+its record, with the number of points n and its index in the classification,
+is appended to a results file of JSON lines as soon as it is done. Designs 
+with a decided verdict in the results file are skipped, so an interrupted 
+sweep resumes where it stopped. A design taking longer than timeout seconds is
+recorded with verdict "timeout", and like an "undecided" design, is tried again
+by the next sweep.
+"""
+DECIDED = ["not embeddable", "possibly embeddable"]
+
+class EmbeddingTimeout(Exception):
+    pass
+
+def raise_timeout(signum, frame):
+    raise EmbeddingTimeout()
+
+# classify design i on n points, giving up after timeout seconds. The record
+# also holds the metrics.take_delta() of the classification under "metrics".
+def embedding_record(n_i, timeout = None, 
+        groebner_timeout = GROEBNER_TIMEOUT, certify = False):
+    n, i = n_i
+    start = time.time()
+    if timeout != None:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            record = classify_embedding(get_configs(n)[i], 
+                groebner_timeout, certify = certify)
+    except EmbeddingTimeout:
+        record = {"fixture": None, "verdict": "timeout", "reason": "timeout",
+            "timings": {}}
+    finally:
+        if timeout != None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    record["timings"]["total"] = time.time() - start
+    record["metrics"] = metrics.take_delta()
+    return dict([("n", n), ("index", i)] + list(record.items()))
+
+# records of the results file, by (n, index). Later records replace earlier ones.
+def load_embedding_results(results_path):
+    results = {}
+    if os.path.exists(results_path):
+        with open(results_path, "r") as resultsf:
+            for line in resultsf:
+                # a line cut short by an interrupted write is ignored
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                results[(record["n"], record["index"])] = record
+    return results
+
+# classify every design with minn <= n <= maxn points, and return the designs 
+# which could be embeddable
+# - processes: size of the process pool, or None for one per cpu. With 1, the 
+#   designs are classified in this process.
+# - timeout: seconds allowed per design, or None for no limit
+# - groebner_timeout: seconds allowed per groebner strategy
+# - results_path: the results file
+# - certify: only accept verdicts computed over the rationals. Designs decided
+#   by the numeric sieve or the modular check in the results file are 
+#   classified again.
+def run_embedding_sweep(minn = 7, maxn = 16, processes = None, timeout = None,
+        results_path = "saved_classification/embedding_results.jsonl",
+        groebner_timeout = GROEBNER_TIMEOUT, certify = False):
+    results = load_embedding_results(results_path)
+    todo = []
+    for num_pts in range(minn, maxn+1):
+        for i in range(len(get_configs(num_pts))):
+            record = results.get((num_pts, i))
+            if record == None or record["verdict"] not in DECIDED or \
+                    (certify and record["reason"] in ["numeric", "modular"]):
+                todo.append((num_pts, i))
+    print("Classifying {} designs, {} already decided".format(len(todo), 
+        sum(len(get_configs(n)) for n in range(minn, maxn+1)) - len(todo)))
+
+    classify = functools.partial(embedding_record, timeout = timeout,
+        groebner_timeout = groebner_timeout, certify = certify)
+    num_saved = [0]
+    with open(results_path, "a") as resultsf:
+        def save(record):
+            resultsf.write(json.dumps(record) + "\n")
+            resultsf.flush()
+            os.fsync(resultsf.fileno())
+            results[(record["n"], record["index"])] = record
+            metrics.count(record["verdict"])
+            num_saved[0] += 1
+            metrics.progress(num_saved[0], len(todo))
+            print("{} points, design {}: {}, {:.2f}s".format(record["n"],
+                record["index"] + 1, record["verdict"], 
+                record["timings"]["total"]))
+
+        # the metrics of a design classified in this process are already
+        # recorded, those of a pool worker are added from its record
+        with metrics.stage("embedding_sweep"):
+            if processes == 1:
+                for n_i in todo:
+                    record = classify(n_i)
+                    record.pop("metrics")
+                    save(record)
+            else:
+                with Pool(processes) as pool:
+                    for record in pool.imap_unordered(classify, todo):
+                        metrics.add_delta(record.pop("metrics"))
+                        save(record)
+
+    possibly_embeddable_pds = []
+    num_undecided = 0
+    for num_pts in range(minn, maxn+1):
+        for i, pd in enumerate(get_configs(num_pts)):
+            verdict = results[(num_pts, i)]["verdict"]
+            if verdict == "possibly embeddable":
+                possibly_embeddable_pds.append(pd)
+            if verdict not in DECIDED:
+                num_undecided += 1
+    print("Possibly embeddable: {}, timed out or undecided: {}".format(
+        len(possibly_embeddable_pds), num_undecided))
+    return possibly_embeddable_pds
 
 # for num_pts in range(7, 17):
 #     print("On designs with ", str(num_pts), " points.")
-#     for i, pd in enumerate(all_configs[num_pts]):
-#         print("\n\nOn {}/{}".format(i+1, len(all_configs[num_pts])))
+#     for i, pd in enumerate(get_configs(num_pts)):
+#         print("\n\nOn {}/{}".format(i+1, len(get_configs(num_pts))))
 #         init, fo = find_forcing_fixture(pd)
 #         if len(init) > 5:
 #             print("COULD NOT FIND FIXTURE OF SIZE 5")
@@ -256,4 +923,52 @@ for num_pts in range(7, 17):
 #             continue
 #         print("Equations:")
 #         for e in zero_eqs:
-#             print(e)
\ No newline at end of file
+#             print(e)
+
+
+help_message = "Use this program to decide which Sylvester-Gallai designs " + \
+               "could be embeddable.\n" + \
+               " -m minimum number of points. Defaults to 7.\n" + \
+               " -M maximum number of points. Defaults to 16.\n" + \
+               " -p number of processes. Defaults to one per cpu.\n" + \
+               " -t timeout in seconds for each design. Defaults to none.\n" +\
+               " -g timeout in seconds for each groebner strategy. " + \
+                    "Defaults to {}.\n".format(GROEBNER_TIMEOUT) + \
+               " -certify decide over the rationals, not by the numeric " + \
+                    "sieve or modular check\n" + \
+               " -o results file. Defaults to " + \
+                    "saved_classification/embedding_results.jsonl\n" + \
+               " -metrics (path) append metrics snapshots to path, see " + \
+                    "metrics.py\n" + \
+               " -h print this message"
+
+# check all designs for 7 through 16 points, or -m minimum to -M maximum
+if __name__ == '__main__':
+    minn = 7
+    maxn = 16
+    processes = None
+    timeout = None
+    results_path = "saved_classification/embedding_results.jsonl"
+    groebner_timeout = GROEBNER_TIMEOUT
+    for a, b in zip(sys.argv, sys.argv[1:]):
+        if a == "-m":
+            minn = int(b)
+        if a == "-M":
+            maxn = int(b)
+        if a == "-p":
+            processes = int(b)
+        if a == "-t":
+            timeout = float(b)
+        if a == "-o":
+            results_path = b
+        if a == "-g":
+            groebner_timeout = float(b)
+        if a == "-metrics":
+            metrics.enable(b)
+    if '-h' in sys.argv:
+        print(help_message)
+        exit()
+
+    possibly_embeddable_pds = run_embedding_sweep(minn, maxn, processes, 
+        timeout, results_path, groebner_timeout, '-certify' in sys.argv)
+    metrics.disable()
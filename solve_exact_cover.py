@@ -1,15 +1,28 @@
 # This very nice implementation of Knuth's algorithm X is due to Ali Assaf
 # https://www.cs.mcgill.ca/~aassaf9/python/algorithm_x.html
 
-import copy 
+try:
+    popcount = int.bit_count
+except AttributeError: # python < 3.10
+    def popcount(x):
+        return bin(x).count("1")
+
+import metrics
 
 # find all set covers of 
-def solve(X, Y, solution=[]):
+# prune_root, if given, is called as prune_root(c, rows) with the first column 
+# chosen and the rows covering it, and returns the rows to branch on. It lets the
+# caller skip rows known to give solutions equivalent to those of other rows.
+def solve(X, Y, solution=[], prune_root=None):
+    metrics.count("cover_nodes")
     if not X:
         yield list(solution)
     else:
         c = min(X, key=lambda c: len(X[c]))
-        for r in list(X[c]):
+        rows = list(X[c])
+        if prune_root is not None:
+            rows = prune_root(c, rows)
+        for r in rows:
             solution.append(r)
             cols = select(X, Y, r)
             for s in solve(X, Y, solution):
@@ -41,4 +54,100 @@ def make_inputs(X0, Y0):
     for i in Y0:
         for j in Y0[i]:
             X1[j].add(i)
-    return copy.deepcopy(X1), copy.deepcopy(Y0)
\ No newline at end of file
+    # X1 is freshly built and solve never modifies Y, so neither needs copying
+    return X1, Y0
+
+# Bitset version of algorithm X, a drop in for solve: takes the same X and Y 
+# and yields the same solutions (possibly in a different order), but leaves X 
+# untouched. Rows and columns are renumbered so that each row is an integer
+# mask of its columns, and each column an integer mask of its rows. The search
+# state is then just two integers: the uncovered columns and the rows still
+# compatible with the partial solution. prune_root is as in solve.
+def solve_bitset(X, Y, prune_root=None):
+    cols = list(X)
+    col_index = {c: i for i, c in enumerate(cols)}
+    rows = list(Y)
+
+    row_cols = [] # mask of the columns in each row
+    col_rows = [0 for c in cols] # mask of the rows containing each column
+    for ri, r in enumerate(rows):
+        mask = 0
+        for c in Y[r]:
+            ci = col_index[c]
+            mask |= 1 << ci
+            col_rows[ci] |= 1 << ri
+        row_cols.append(mask)
+
+    # rows sharing a column with each row, including the row itself
+    conflicts = []
+    for mask in row_cols:
+        conflict = 0
+        while mask:
+            low = mask & -mask
+            conflict |= col_rows[low.bit_length() - 1]
+            mask ^= low
+        conflicts.append(conflict)
+
+    # translate prune_root to work on column and row numbers
+    prune_masks = None
+    if prune_root is not None:
+        row_index = {r: i for i, r in enumerate(rows)}
+        def prune_masks(ci, c_rows):
+            kept = prune_root(cols[ci], [rows[ri] for ri in mask_bits(c_rows)])
+            mask = 0
+            for r in kept:
+                mask |= 1 << row_index[r]
+            return mask
+
+    all_cols = (1 << len(cols)) - 1
+    all_rows = (1 << len(rows)) - 1
+    for s in _solve_masks(all_cols, all_rows, row_cols, col_rows, conflicts, [],
+            prune_masks):
+        yield [rows[ri] for ri in s]
+
+# positions of the set bits of mask, in increasing order
+def mask_bits(mask):
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
+
+def _solve_masks(uncovered, active, row_cols, col_rows, conflicts, solution,
+        prune_masks=None):
+    metrics.count("cover_nodes")
+    if not uncovered:
+        yield list(solution)
+        return
+
+    # choose the uncovered column with the fewest compatible rows
+    best_col = None
+    best_rows = None
+    best_count = None
+    cols_left = uncovered
+    while cols_left:
+        low = cols_left & -cols_left
+        cols_left ^= low
+        c_rows = col_rows[low.bit_length() - 1] & active
+        count = popcount(c_rows)
+        if best_count is None or count < best_count:
+            best_col, best_rows, best_count = low.bit_length() - 1, c_rows, count
+            if count <= 1:
+                break
+
+    if prune_masks is not None and best_count > 1:
+        best_rows = prune_masks(best_col, best_rows)
+
+    while best_rows:
+        low = best_rows & -best_rows
+        best_rows ^= low
+        r = low.bit_length() - 1
+        solution.append(r)
+        for s in _solve_masks(uncovered & ~row_cols[r], active & ~conflicts[r],
+                row_cols, col_rows, conflicts, solution):
+            yield s
+        solution.pop()
+
+# exact cover solvers that can be chosen by name
+EXACT_COVER_BACKENDS = {"algx": solve, "bitset": solve_bitset}
\ No newline at end of file
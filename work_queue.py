@@ -0,0 +1,287 @@
+# Classification on several machines through a work queue in a shared
+# directory. A coordinator finds the seeds of the classification on npoints
+# points and writes them in shards, workers on any host sharing the directory
+# claim shards and complete their seeds, and a merge step deduplicates the
+# designs found into saved_classification, as compute_and_save would.
+#
+# The queue directory holds
+#  - job.json: npoints and the options of the search, written once all shards
+#    are, so workers wait for it before starting
+#  - pending/<shard>: shards not claimed yet. A shard has a first line
+#    "<stage> <minlen>", and then a line "<seed index> <line masks>" for each
+#    seed, with the masks comma separated.
+#  - claimed/<shard>.<host>.<pid>: shards being completed. A worker claims a
+#    shard by renaming it here, which only one worker can do, and touches it
+#    every HEARTBEAT_INTERVAL seconds while completing it, so that its mtime
+#    is the last sign of life of the worker.
+#  - results/<shard>: a line "<seed index> <position> <certificate in hex>
+#    <line masks>" for each completion found, followed by a line "done".
+#    Written under a temporary name and then renamed.
+#
+# Usage:
+#  python work_queue.py coordinator -n npoints -d dir [-shard seeds per shard]
+#      [-multi y/n] [-cover algx/bitset] [-canon y/n] [-sym y/n]
+#  python work_queue.py worker -d dir
+#  python work_queue.py requeue -d dir -age seconds (well above 
+#      HEARTBEAT_INTERVAL)
+#  python work_queue.py merge -d dir [-certmem bytes]
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import sg_design_finder
+from sg_design_finder import find_min3_seeds, find_min4_seeds, \
+    completion_records, design_from_masks, line_mask, save_classification, \
+    new_certificate_store
+
+# stages in the order their designs are listed, and the minimum line length of
+# their completions
+STAGES = [("min4", 4), ("min3", 3)]
+
+# seconds between touches of a claimed shard by its worker
+HEARTBEAT_INTERVAL = 60
+
+def shard_name(stage, shard):
+    return "{}_{:06d}".format(stage, shard)
+
+def write_atomic(path, text):
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+# find the seeds on npoints points, and write them to the queue in shards of
+# shard_size seeds
+def coordinate(npoints, queue_dir, shard_size = 100, multithreaded = True,
+        cover_backend = "algx", canonical = False, symmetry_pruning = False):
+    for sub in ["pending", "claimed", "results"]:
+        os.makedirs(os.path.join(queue_dir, sub), exist_ok = True)
+    if os.path.exists(os.path.join(queue_dir, "job.json")):
+        raise ValueError("{} already holds a job".format(queue_dir))
+
+    all_seeds = {
+        "min4": find_min4_seeds(npoints, multithreaded, canonical),
+        "min3": find_min3_seeds(npoints, multithreaded, cover_backend,
+            canonical, symmetry_pruning),
+    }
+
+    num_shards = {}
+    for stage, minlen in STAGES:
+        seeds = all_seeds[stage]
+        num_shards[stage] = (len(seeds) + shard_size - 1) // shard_size
+        for shard in range(num_shards[stage]):
+            lines = ["{} {}".format(stage, minlen)]
+            for i in range(shard * shard_size,
+                    min(len(seeds), (shard + 1) * shard_size)):
+                masks = [line_mask(l) for l in seeds[i].lines]
+                lines.append("{} {}".format(i, ",".join(map(str, masks))))
+            write_atomic(os.path.join(queue_dir, "pending",
+                shard_name(stage, shard)), "\n".join(lines) + "\n")
+        print("Wrote {} seeds of stage {} in {} shards".format(len(seeds),
+            stage, num_shards[stage]))
+
+    job = {"npoints": npoints, "cover_backend": cover_backend,
+        "canonical": canonical, "symmetry_pruning": symmetry_pruning,
+        "num_shards": num_shards}
+    write_atomic(os.path.join(queue_dir, "job.json"), json.dumps(job))
+
+def load_job(queue_dir):
+    with open(os.path.join(queue_dir, "job.json"), "r") as jobf:
+        return json.load(jobf)
+
+# claim a pending shard. Returns the shard name and the path it was claimed
+# to, or None if no shard is pending.
+def claim_shard(queue_dir):
+    tag = "{}.{}".format(socket.gethostname(), os.getpid())
+    for shard in sorted(os.listdir(os.path.join(queue_dir, "pending"))):
+        if shard.endswith(".tmp"):
+            continue
+        claimed = os.path.join(queue_dir, "claimed", shard + "." + tag)
+        try:
+            os.rename(os.path.join(queue_dir, "pending", shard), claimed)
+        except FileNotFoundError:
+            # another worker claimed it first
+            continue
+        # the rename keeps the mtime of when the shard was written
+        os.utime(claimed)
+        return shard, claimed
+    return None
+
+# touch the claimed shard every HEARTBEAT_INTERVAL seconds until stop is set,
+# or the claim is gone
+def heartbeat(claimed, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            os.utime(claimed)
+        except FileNotFoundError:
+            return
+
+# complete the seeds of a claimed shard, and write its results. Returns False
+# if the claim was requeued before the shard could be read. A claim requeued 
+# later is still completed, and its results written, as they are the same 
+# whichever worker writes them.
+def complete_shard(queue_dir, job, shard, claimed):
+    n = job["npoints"]
+    try:
+        with open(claimed, "r") as shardf:
+            stage, minlen = shardf.readline().split()
+            seeds = []
+            for line in shardf:
+                i, masks = line.split()
+                seeds.append((int(i), [int(m) for m in masks.split(",")]))
+    except FileNotFoundError:
+        print("Shard {} was requeued".format(shard))
+        return False
+
+    stop = threading.Event()
+    threading.Thread(target = heartbeat, args = (claimed, stop), 
+        daemon = True).start()
+    try:
+        results = []
+        for i, masks in seeds:
+            i, records, delta = completion_records(
+                (i, design_from_masks(n, masks)), minlen = int(minlen), 
+                cover_backend = job["cover_backend"],
+                canonical = job["canonical"],
+                symmetry_pruning = job["symmetry_pruning"])
+            for pos, (h, masks) in enumerate(records):
+                results.append("{} {} {} {}".format(i, pos, h.hex(),
+                    ",".join(map(str, masks))))
+        results.append("done")
+        write_atomic(os.path.join(queue_dir, "results", shard),
+            "\n".join(results) + "\n")
+    finally:
+        stop.set()
+    try:
+        os.remove(claimed)
+    except FileNotFoundError:
+        pass
+    return True
+
+# claim and complete shards until none are left
+def run_worker(queue_dir, poll = 5):
+    while not os.path.exists(os.path.join(queue_dir, "job.json")):
+        print("Waiting for the coordinator")
+        time.sleep(poll)
+    job = load_job(queue_dir)
+
+    num_done = 0
+    while True:
+        claim = claim_shard(queue_dir)
+        if claim == None:
+            break
+        shard, claimed = claim
+        start = time.time()
+        if complete_shard(queue_dir, job, shard, claimed):
+            num_done += 1
+            print("Completed shard {} in {:.1f}s".format(shard,
+                time.time() - start))
+    print("No shards left, completed {}".format(num_done))
+
+# return the claimed shards not touched for age seconds to pending, eg. after
+# the worker holding them died
+def requeue(queue_dir, age):
+    for claimed in os.listdir(os.path.join(queue_dir, "claimed")):
+        path = os.path.join(queue_dir, "claimed", claimed)
+        shard = claimed.split(".")[0]
+        try:
+            if time.time() - os.path.getmtime(path) > age and not \
+                    os.path.exists(os.path.join(queue_dir, "results", shard)):
+                os.rename(path, os.path.join(queue_dir, "pending", shard))
+                print("Requeued", shard)
+        except FileNotFoundError:
+            # the worker finished the shard meanwhile
+            continue
+
+# merge the results of all shards, keeping for each certificate the design from
+# the earliest seed, so that the designs are those, in the order, that
+# compute_and_save finds, and save them to saved_classification
+def merge(queue_dir):
+    job = load_job(queue_dir)
+    n = job["npoints"]
+
+    missing = []
+    for stage, minlen in STAGES:
+        for shard in range(job["num_shards"][stage]):
+            fn = os.path.join(queue_dir, "results", shard_name(stage, shard))
+            if not os.path.exists(fn):
+                missing.append(shard_name(stage, shard))
+    if missing:
+        raise ValueError("shards without results: " + " ".join(missing))
+
+    all_designs = []
+    for stage, minlen in STAGES:
+        known = new_certificate_store()
+        kept = []
+        for shard in range(job["num_shards"][stage]):
+            fn = os.path.join(queue_dir, "results", shard_name(stage, shard))
+            with open(fn, "r") as resultf:
+                for line in resultf:
+                    parts = line.split()
+                    if parts == ["done"]:
+                        break
+                    i, pos, h, masks = parts
+                    # shards hold consecutive seeds and are read in order, so
+                    # the first design of a certificate is the earliest
+                    if known.add(bytes.fromhex(h)) == len(kept):
+                        kept.append([int(m) for m in masks.split(",")])
+                else:
+                    raise ValueError("results of {} are incomplete".format(fn))
+        known.close()
+        print("Merged {} designs of stage {}".format(len(kept), stage))
+        all_designs += [design_from_masks(n, masks) for masks in kept]
+
+    save_classification(n, all_designs)
+    print("Saved {} designs on {} points".format(len(all_designs), n))
+    return all_designs
+
+
+if __name__ == '__main__':
+    queue_dir = None
+    npoints = None
+    shard_size = 100
+    multithreaded = True
+    cover_backend = "algx"
+    canonical = False
+    symmetry_pruning = False
+    age = 3600
+    for a, b in zip(sys.argv, sys.argv[1:]):
+        if a == "-d":
+            queue_dir = b
+        if a == "-n":
+            npoints = int(b)
+        if a == "-shard":
+            shard_size = int(b)
+        if a == "-multi":
+            multithreaded = (b == 'y')
+        if a == "-cover":
+            cover_backend = b
+        if a == "-canon":
+            canonical = (b == 'y')
+        if a == "-sym":
+            symmetry_pruning = (b == 'y')
+        if a == "-age":
+            age = float(b)
+        if a == "-certmem":
+            sg_design_finder.CERTIFICATE_MEMORY = int(b)
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else None
+    if queue_dir == None or mode not in \
+            ["coordinator", "worker", "requeue", "merge"]:
+        print("Usage: python work_queue.py coordinator/worker/requeue/merge " +
+            "-d queue_dir [options], see the top of work_queue.py")
+        exit()
+
+    if mode == "coordinator":
+        coordinate(npoints, queue_dir, shard_size, multithreaded,
+            cover_backend, canonical, symmetry_pruning)
+    if mode == "worker":
+        run_worker(queue_dir)
+    if mode == "requeue":
+        requeue(queue_dir, age)
+    if mode == "merge":
+        merge(queue_dir)